@@ -0,0 +1,194 @@
+# 지표 계산, 캐시 연산, 알람 조건 검사의 실행 시간을 측정해 JSON으로 출력함
+# 사용법: python -m benchmark.benchmark [결과 JSON 파일] [비교할 이전 결과 JSON 파일]
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from watcher import functions
+from watcher.cache import Cache
+from watcher.definition import BINANCE_ID, Interval, Candle
+from watcher.watcher import Watcher
+from benchmark.load_test import isolate_snapshot, make_alarms
+
+SYMBOL = 'SYM0/USDT'
+
+
+def measure(name: str, params: dict, function: Callable, repeat: int = 5) -> dict:
+    """
+    function을 여러 번 실행해 한 번 실행하는 데 걸린 시간을 측정함
+    :param name: str, 측정 대상 이름
+    :param params: dict, 측정 조건
+    :param function: Callable, 인자 없이 호출할 함수
+    :param repeat: int, 측정 반복 횟수, 가장 빠른 측정값을 결과로 사용함
+    :return: dict, 측정 결과
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+    result = {'name': name, 'params': params, 'seconds_per_call': seconds, 'calls_per_second': 1 / seconds}
+    print(f"{name:<28} {json.dumps(params):<40} {seconds * 1e6:>12.2f} us", file=sys.stderr)
+    return result
+
+
+def random_walk(length: int, rng: random.Random) -> List[float]:
+    price = 100.0
+    prices = []
+    for _ in range(length):
+        price *= 1 + rng.gauss(0, 0.001)
+        prices.append(price)
+    return prices
+
+
+def make_order_book(levels: int, rng: random.Random) -> dict:
+    return {
+        'symbol': SYMBOL,
+        'bids': [[100 - level * 0.01, rng.expovariate(0.1)] for level in range(1, levels + 1)],
+        'asks': [[100 + level * 0.01, rng.expovariate(0.1)] for level in range(1, levels + 1)]
+    }
+
+
+def make_trade(rng: random.Random) -> dict:
+    price = 100 + rng.gauss(0, 1)
+    amount = rng.expovariate(1.0)
+    return {'symbol': SYMBOL, 'timestamp': None, 'price': price, 'amount': amount, 'cost': price * amount,
+            'side': 'buy'}
+
+
+# 캔들 depth개가 채워진 캐시를 만듦
+def make_cache(depth: int, intervals: List[Interval]) -> Cache:
+    cache = Cache(candle_depth=depth)
+    rng = random.Random(1)
+    for interval in intervals:
+        cache.create_candle_storage(BINANCE_ID, SYMBOL, interval)
+        closes = random_walk(depth, rng)
+        current_timestamp = int(time.time())
+        current_timestamp -= current_timestamp % interval.to_second
+        for index, close in enumerate(closes):
+            timestamp = current_timestamp - interval.to_second * (depth - 1 - index)
+            candle = Candle(BINANCE_ID, SYMBOL, datetime.fromtimestamp(timestamp), interval)
+            candle.open = candle.high = candle.low = candle.close = close
+            cache.add_candle(candle)
+    cache.cache_order_book(make_order_book(20, rng), BINANCE_ID, SYMBOL)
+    return cache
+
+
+def benchmark_functions() -> List[dict]:
+    rng = random.Random(0)
+    results = []
+    for length in (100, 1000, 10000):
+        closes = random_walk(length, rng)
+        results.append(measure('functions.rsi', {'candles': length}, lambda: functions.rsi(closes, 14)))
+        results.append(measure('functions.bollinger_band', {'candles': length},
+                               lambda: functions.bollinger_band(closes)))
+    for levels in (20, 100, 500):
+        order_book = make_order_book(levels, rng)
+        results.append(measure('functions.filter_whale', {'levels': levels},
+                               lambda: functions.filter_whale(order_book, 500)))
+    return results
+
+
+def benchmark_cache() -> List[dict]:
+    rng = random.Random(0)
+    results = []
+    intervals = [Interval(string=string) for string in ('1m', '5m', '15m', '1h')]
+    for depth in (100, 1000, 10000):
+        cache = make_cache(depth, intervals)
+        trade = make_trade(rng)
+        results.append(measure('Cache.cache_trade', {'candles': depth, 'intervals': len(intervals)},
+                               lambda: cache.cache_trade(trade, BINANCE_ID)))
+        # 가득 찬 저장소에 캔들을 추가해 가장 오래된 캔들이 밀려나도록 함
+        interval = intervals[0]
+        last_timestamp = cache.get_last_candle(BINANCE_ID, SYMBOL, interval).timestamp
+        steps = itertools.count(1)
+
+        # 캔들 객체를 만드는 시간을 포함함
+        def add_next_candle():
+            timestamp = last_timestamp + interval.to_second * next(steps)
+            return cache.add_candle(Candle(BINANCE_ID, SYMBOL, datetime.fromtimestamp(timestamp), interval))
+
+        results.append(measure('Cache.add_candle', {'candles': depth}, add_next_candle))
+        # 최근 절반 구간 조회
+        candles = cache.get_candles(BINANCE_ID, SYMBOL, interval)
+        since = candles[len(candles) // 2].timestamp
+        results.append(measure('Cache.get_candles', {'candles': depth},
+                               lambda: cache.get_candles(BINANCE_ID, SYMBOL, interval, since=since)))
+    for levels in (20, 100, 500):
+        cache = make_cache(100, intervals)
+        order_book = make_order_book(levels, rng)
+
+        # 호가가 바뀔 때마다 고래 인덱스를 새로 만드는 경우
+        def get_whales_on_new_order_book():
+            cache.cache_order_book(order_book, BINANCE_ID, SYMBOL)
+            return cache.get_whales(BINANCE_ID, SYMBOL, 500)
+
+        results.append(measure('Cache.get_whales', {'levels': levels, 'order_book': 'changed'},
+                               get_whales_on_new_order_book))
+        # 같은 호가에서 다시 찾는 경우
+        results.append(measure('Cache.get_whales', {'levels': levels, 'order_book': 'unchanged'},
+                               lambda: cache.get_whales(BINANCE_ID, SYMBOL, 500)))
+    return results
+
+
+def benchmark_check_alarm() -> List[dict]:
+    rng = random.Random(0)
+    results = []
+    for alarms_count in (1, 10, 100, 1000):
+        watcher = Watcher(_database=None, bot=None)
+        isolate_snapshot(watcher)
+        watcher.cache = make_cache(100, [Interval(string=string) for string in ('1m', '5m', '15m', '1h')])
+        alarms = make_alarms(1, alarms_count)
+        trades = [make_trade(rng) for _ in range(100)]
+        trade_iterator = itertools.cycle(trades)
+
+        # 거래 하나를 종목의 모든 알람으로 검사함
+        def check_alarms():
+            trade = next(trade_iterator)
+            for alarm in alarms:
+                watcher.check_alarm(alarm, trade)
+
+        results.append(measure('Watcher.check_alarm', {'alarms': alarms_count}, check_alarms))
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+# 이전 결과와 같은 항목의 실행 시간 비율을 출력함
+def compare(results: List[dict], baseline_results: List[dict]):
+    baseline: Dict[str, float] = {
+        result['name'] + json.dumps(result['params']): result['seconds_per_call'] for result in baseline_results
+    }
+    print("\n이전 결과 대비 실행 시간 비율")
+    for result in results:
+        key = result['name'] + json.dumps(result['params'])
+        if key in baseline:
+            print(f"{result['name']:<28} {json.dumps(result['params']):<40} "
+                  f"{result['seconds_per_call'] / baseline[key]:>8.2f}x")
+
+
+if __name__ == '__main__':
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'created_at': datetime.now().isoformat(),
+        'results': benchmark_functions() + benchmark_cache() + benchmark_check_alarm()
+    }
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'r') as file:
+            compare(report['results'], json.load(file)['results'])
@@ -0,0 +1,114 @@
+# 가짜 거래소로 Watcher에 부하를 걸어 종목/알람 수에 따른 지연을 측정함
+# 사용법: python -m benchmark.load_test [종목 수] [종목당 알람 수] [종목당 초당 거래 수] [측정 시간(초)]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List
+
+from database.definition import Condition
+from watcher.connection import ExchangeConnection
+from watcher.definition import BINANCE_ID
+from watcher.fake_exchange import FakeExchange
+from watcher.snapshot import CandleSnapshot
+from watcher.watcher import Alarm, Watcher
+
+
+# 운영 중인 캔들 스냅샷 파일을 읽거나 덮어쓰지 않도록 감시자가 임시 디렉터리의 스냅샷을 사용하게 함
+def isolate_snapshot(watcher: Watcher):
+    watcher.snapshot_directory = tempfile.TemporaryDirectory()
+    watcher.snapshot = CandleSnapshot(os.path.join(watcher.snapshot_directory.name, Watcher.snapshot_path))
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent_count = 0
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent_count += 1
+
+
+class LoadTestWatcher(Watcher):
+    def __init__(self, trade_rate: float):
+        super().__init__(_database=None, bot=FakeBot(),
+                         exchange_factory=lambda exchange_id: FakeExchange(trade_rate=trade_rate))
+        isolate_snapshot(self)
+        # 거래소에서 거래가 체결된 시각부터 조건을 검사하기까지 걸린 시간(밀리초)
+        self.latencies: List[float] = []
+        self.check_count = 0
+
+    def check_alarm(self, alarm: Alarm, trade):
+        self.check_count += 1
+        self.latencies.append(time.time() * 1000 - trade['timestamp'])
+        return super().check_alarm(alarm, trade)
+
+
+def random_condition(rng: random.Random, alarm_id: int) -> Condition:
+    def interval(timeframe: str) -> dict:
+        return {'length': int(timeframe[:-1]), 'timeframe': timeframe[-1]}
+
+    return {
+        'alarm_id': alarm_id,
+        'whale': rng.choice([None, {'quantity': rng.uniform(500, 5000)}]),
+        'tick': rng.choice([None, {'quantity': rng.uniform(1, 5)}]),
+        'rsi': rng.choice([None, {'length': 14, 'upper_bound': 70, 'lower_bound': 30,
+                                  'interval': interval(rng.choice(['1m', '5m', '15m']))}]),
+        'bollinger_band': rng.choice([None, {'length': 20, 'coefficient': 2, 'on_over_upper_band': True,
+                                             'on_under_lower_band': True,
+                                             'interval': interval(rng.choice(['1m', '15m', '1h']))}])
+    }
+
+
+def make_alarms(symbols_count: int, alarms_per_symbol: int) -> List[Alarm]:
+    rng = random.Random(0)
+    alarms = []
+    for symbol_index in range(symbols_count):
+        for _ in range(alarms_per_symbol):
+            alarm_id = len(alarms) + 1
+            alarm = {'alarm_id': alarm_id, 'channel_id': 0, 'exchange_id': BINANCE_ID,
+                     'base_symbol': f'SYM{symbol_index}', 'quote_symbol': 'USDT', 'is_enabled': True}
+            alarms.append(Alarm(alarm=alarm, condition=random_condition(rng, alarm_id)))
+    return alarms
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+async def measure_loop_lag(lags: List[float], period: float = 0.1):
+    while True:
+        started_at = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append((time.perf_counter() - started_at - period) * 1000)
+
+
+async def main(symbols_count: int, alarms_per_symbol: int, trade_rate: float, duration: float):
+    watcher = LoadTestWatcher(trade_rate)
+    alarms = make_alarms(symbols_count, alarms_per_symbol)
+    asyncio.ensure_future(watcher.cache.candle_update_task())
+    await watcher.bootstrap(alarms)
+    # 묶음 구독 요청이 모두 시작된 뒤부터 측정함
+    await asyncio.sleep(ExchangeConnection.batch_delay * 2)
+    watcher.latencies.clear()
+    watcher.check_count = 0
+    loop_lags: List[float] = []
+    asyncio.ensure_future(measure_loop_lag(loop_lags))
+    await asyncio.sleep(duration)
+    print(f"종목 {symbols_count}개, 알람 {len(alarms)}개, 종목당 초당 거래 {trade_rate}개, {duration}초 측정")
+    print(f"조건 검사: 초당 {watcher.check_count / duration:,.0f}회, 전송한 알림: {watcher.bot.sent_count}개")
+    print(f"거래 체결부터 조건 검사까지 지연(ms): p50 {percentile(watcher.latencies, 0.5):.1f}, "
+          f"p99 {percentile(watcher.latencies, 0.99):.1f}, 최대 {max(watcher.latencies, default=0.0):.1f}")
+    print(f"이벤트 루프 지연(ms): p50 {percentile(loop_lags, 0.5):.1f}, p99 {percentile(loop_lags, 0.99):.1f}")
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    asyncio.run(main(symbols_count=int(arguments[0]) if len(arguments) > 0 else 50,
+                     alarms_per_symbol=int(arguments[1]) if len(arguments) > 1 else 10,
+                     trade_rate=float(arguments[2]) if len(arguments) > 2 else 10.0,
+                     duration=float(arguments[3]) if len(arguments) > 3 else 30.0))
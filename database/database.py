@@ -1,6 +1,6 @@
 # 데이터베이스 API
 import json
-from typing import List
+from typing import List, Tuple
 
 from database.connection import connect
 
@@ -48,7 +48,8 @@ class Database:
         'chat': 'chat_id',
         'channel': 'channel_id',
         'alarm': 'alarm_id',
-        'condition': 'alarm_id'
+        'condition': 'alarm_id',
+        'outbox': 'outbox_id'
     }
 
     def __init__(self, database_url: str, debug=False):
@@ -63,7 +64,9 @@ class Database:
     @staticmethod
     def to_comparison_value(value):
         if type(value) is str:
-            return f'\'{value}\''
+            # 문자열 안의 따옴표는 두 번 써서 이스케이프함
+            escaped_value = value.replace("'", "''")
+            return f'\'{escaped_value}\''
 
         elif type(value) is dict:
             return f"\'{json.dumps(value)}\'"
@@ -172,6 +175,32 @@ class Database:
         # 입력한 열의 기본 키 반환
         return result_set.data[0][0]
 
+    def insert_many(self, table_name: str, rows: List[dict]) -> List[int]:
+        """
+        여러 열을 INSERT문 하나로 입력하고 입력한 열들의 ID를 입력한 순서대로 반환함
+        :param table_name: str, 테이블명
+        :param rows: List[Dict[str, Any]], 입력할 열 리스트, 모든 열은 같은 컬럼을 가져야 함
+        :return: List[int], 입력한 열들의 기본 키
+        """
+        if not rows:
+            return []
+        # 값을 입력할 컬럼
+        columns = tuple(rows[0].keys())
+        # 해당 테이블의 기본 키 컬럼명
+        primary_column = self.get_primary_column(table_name)
+        # 컬럼 지정문
+        column_statement = ', '.join(columns)
+        # 열마다의 값 지정문
+        values_statement = ', '.join(
+            f"({self.to_parameter_statement(', ', *(row[column] for column in columns))})" for row in rows
+        )
+        # 실행할 쿼리문
+        query = f"INSERT INTO {table_name} ({column_statement}) VALUES {values_statement}"
+        query += f" RETURNING {primary_column};"
+        # PostgreSQL은 여러 열을 입력할 때 VALUES에 쓴 순서대로 RETURNING 결과를 반환함
+        result_set = self.execute(query)
+        return [row[0] for row in result_set.data]
+
     def update(self, table_name: str, primary_key: int, **kwargs):
         """
         UPDATE문을 실행함
@@ -239,3 +268,59 @@ class Database:
 
     def is_alarm_exists(self, alarm_id: int) -> bool:
         return self.is_exists(table_name='alarm', primary_key=alarm_id)
+
+    # 전송할 알림을 기록하는 outbox 테이블이 없으면 생성함
+    def create_outbox_table(self):
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "outbox_id BIGSERIAL PRIMARY KEY, "
+            "chat_id BIGINT NOT NULL, "
+            "text TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+            # 새 알림은 전송 대기열에서 바로 전송되므로 1분이 지나도 전송되지 않은 경우에만 재전송함
+            "next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now() + interval '1 minute', "
+            "delivered_at TIMESTAMPTZ);"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_undelivered_index ON outbox (next_attempt_at) "
+            "WHERE delivered_at IS NULL;"
+        )
+
+    def insert_outbox(self, messages: List[Tuple[int, str]]) -> List[int]:
+        """
+        알림들을 outbox 테이블에 입력함
+        :param messages: List[Tuple[int, str]], (채팅방 ID, 메시지) 리스트
+        :return: List[int], 입력한 알림들의 outbox ID
+        """
+        return self.insert_many('outbox', [{'chat_id': chat_id, 'text': text} for chat_id, text in messages])
+
+    # 해당 알림들을 전송 완료로 표시함
+    def mark_outbox_delivered(self, outbox_ids: List[int]):
+        if not outbox_ids:
+            return
+        id_statement = self.to_parameter_statement(', ', *outbox_ids)
+        self.execute(f"UPDATE outbox SET delivered_at=now() WHERE outbox_id IN ({id_statement});")
+
+    def select_undelivered_outbox(self, max_attempts: int, limit: int) -> ResultSet:
+        """
+        다시 보낼 시각이 된 전송되지 않은 알림들을 불러옴
+        :param max_attempts: int, 재전송 횟수가 이 값 이상인 알림은 불러오지 않음
+        :param limit: int, 불러올 최대 알림 수
+        :return: ResultSet, outbox_id, chat_id, text, attempts 컬럼의 결과 집합
+        """
+        query = "SELECT outbox_id, chat_id, text, attempts FROM outbox "
+        query += f"WHERE delivered_at IS NULL AND next_attempt_at <= now() AND attempts < {max_attempts} "
+        query += f"ORDER BY outbox_id LIMIT {limit};"
+        return self.execute(query)
+
+    # 해당 알림들의 재전송 횟수를 늘리고, 다음 재전송 시각을 retry_delay * 2^(재전송 횟수)초 뒤로 미룸
+    def reschedule_outbox(self, outbox_ids: List[int], retry_delay: float):
+        if not outbox_ids:
+            return
+        id_statement = self.to_parameter_statement(', ', *outbox_ids)
+        self.execute(
+            f"UPDATE outbox SET attempts=attempts + 1, "
+            f"next_attempt_at=now() + make_interval(secs => {retry_delay} * power(2, attempts)) "
+            f"WHERE outbox_id IN ({id_statement});"
+        )
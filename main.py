@@ -1,18 +1,21 @@
-import sys
 import json
 
 from telebot.async_telebot import AsyncTeleBot
 
 from database.database import Database
+from watcher.recorder import TapeRecorder
 from watcher.watcher import Watcher
 
 
 if __name__ == '__main__':
-    sys.setrecursionlimit(10 ** 7)
-
     with open('token.json', 'r') as file:
         tokens = json.load(file)
         database = Database(tokens['database_url'])
         telebot = AsyncTeleBot(tokens['telegram_bot_token'])
-        watcher = Watcher(_database=database, bot=telebot)
+        # token.json에 record_directory가 있으면 받은 거래와 호가를 해당 디렉터리에 기록함
+        recorder = TapeRecorder(tokens['record_directory']) if 'record_directory' in tokens else None
+        # token.json에 metrics_port가 있으면 해당 포트로 처리량과 상태를 Prometheus 형식으로 내보냄
+        # token.json에 candle_depth가 있으면 종목/인터벌마다 해당 개수만큼 캔들을 캐시함
+        watcher = Watcher(_database=database, bot=telebot, recorder=recorder, metrics_port=tokens.get('metrics_port'),
+                          candle_depth=tokens.get('candle_depth', 100))
         watcher.run()
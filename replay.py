@@ -0,0 +1,19 @@
+import json
+import sys
+
+from watcher.replay import Replay, load_alarms
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("사용법: python replay.py <기록 디렉터리> <알람 JSON 파일> [알림 출력 JSON 파일]")
+        sys.exit(1)
+    replay = Replay(sys.argv[1], load_alarms(sys.argv[2]))
+    report = replay.run()
+    print(f"거래 {report['trades']}개, 호가 {report['order_books']}개 재생 ({report['elapsed_seconds']:.2f}초, "
+          f"초당 거래 {report['trades_per_second']:.0f}개)")
+    for alarm_id, fire_count in report['fire_counts'].items():
+        print(f"알람 {alarm_id}: {fire_count}회")
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], 'w') as file:
+            json.dump(replay.alerts, file, ensure_ascii=False, indent=2)
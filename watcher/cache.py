@@ -1,36 +1,234 @@
 import asyncio
+import heapq
+import sys
+import time
 from datetime import datetime
-from typing import List, Dict, TypedDict
+from functools import reduce
+from math import gcd
+from typing import Callable, List, Dict, Optional, Set, Tuple
 
 from ccxt.base.types import Trade, OrderBook
 
 from watcher.definition import UPBIT_ID, BINANCE_ID
-from watcher.definition import Interval, Candle
+from watcher.definition import Interval, Candle, CandleSeries, ClockOffset, WhaleIndex
+from watcher.indicator import RsiState, BollingerBandState
 
 
 class Cache:
-    def __init__(self):
-        self.candles = {
+    def __init__(self, candle_depth: int = 100, rollover_delay: float = 1.0, clock: Callable[[], float] = time.time):
+        # (거래소, 종목, 인터벌)별로 저장하는 최대 캔들 수
+        self.candle_depth = candle_depth
+        # 현재 로컬 시각을 반환하는 함수, 기록된 데이터를 재생할 때는 가상 시계로 바꿈
+        self.clock = clock
+        # 거래가 없는 종목의 캔들을 거래소 시각 기준 마감 시각보다 늦게 마감하는 시간, 늦게 도착한 거래를 기다림
+        self.rollover_delay = rollover_delay
+
+        self.candles: Dict[int, Dict[str, Dict[Interval, CandleSeries]]] = {
+            UPBIT_ID: {},
+            BINANCE_ID: {}
+        }
+
+        # 종목별로 알람이 감시하는 인터벌
+        self.watched_intervals: Dict[int, Dict[str, Set[Interval]]] = {
+            UPBIT_ID: {},
+            BINANCE_ID: {}
+        }
+
+        # 종목별 기준 인터벌, 감시하는 인터벌들의 최대공약수
+        # 거래는 기준 인터벌의 캔들에만 캐시하고, 더 긴 인터벌의 캔들은 기준 캔들이 마감될 때마다 합쳐서 갱신함
+        self.base_intervals: Dict[int, Dict[str, Interval]] = {
             UPBIT_ID: {},
             BINANCE_ID: {}
         }
 
+        # 거래소별로 기준 캔들이 마감되는 시각 순서로 정렬된 (마감 타임스탬프, 종목) 힙
+        self.rollover_schedules: Dict[int, List[Tuple[int, str]]] = {
+            UPBIT_ID: [],
+            BINANCE_ID: []
+        }
+        # (거래소, 종목)별로 예약된 다음 마감 타임스탬프, 힙에서 이와 다른 항목은 취소된 예약으로 보고 무시함
+        self.next_rollover_timestamps: Dict[Tuple[int, str], int] = {}
+        # 더 이른 마감이 예약되었을 때 대기 중인 캔들 갱신 태스크를 깨우는 이벤트
+        self.rollover_schedule_changed: Optional[asyncio.Event] = None
+        # 거래소별 로컬 시각과 거래소 시각의 차이
+        self.clock_offsets: Dict[int, ClockOffset] = {
+            UPBIT_ID: ClockOffset(),
+            BINANCE_ID: ClockOffset()
+        }
+
         self.order_books = {
             UPBIT_ID: {},
             BINANCE_ID: {}
         }
 
+        # (종목, 인터벌, 길이)별 RSI 상태
+        self.rsi_states: Dict[int, Dict[str, Dict[Interval, Dict[int, RsiState]]]] = {
+            UPBIT_ID: {},
+            BINANCE_ID: {}
+        }
+
+        # (종목, 인터벌, 길이)별 볼린저 밴드 상태
+        self.bollinger_band_states: Dict[int, Dict[str, Dict[Interval, Dict[int, BollingerBandState]]]] = {
+            UPBIT_ID: {},
+            BINANCE_ID: {}
+        }
+
+        # 종목별 호가 버전, 호가가 갱신될 때마다 1씩 증가함
+        self.order_book_versions = {
+            UPBIT_ID: {},
+            BINANCE_ID: {}
+        }
+
+        # 종목별 고래 인덱스, 호가 버전이 바뀌면 다시 만들어짐
+        self.whale_indexes: Dict[int, Dict[str, WhaleIndex]] = {
+            UPBIT_ID: {},
+            BINANCE_ID: {}
+        }
+
     # 캔들 캐시 공간 확보
     def create_candle_storage(self, exchange_id: int, symbol: str, interval: Interval):
         candle_storage_for_exchange = self.candles[exchange_id]     # 거래소에 대한 캔들 저장소
         # 해당 종목에 대한 공간이 확보되어 있지 않을 경우 공간 확보
         if symbol not in candle_storage_for_exchange:
             candle_storage_for_exchange[symbol] = {}
+            self.watched_intervals[exchange_id][symbol] = set()
 
         candle_storage_for_symbol = candle_storage_for_exchange[symbol]     # 종목에 대한 캔들 저장소
         # 해당 인터벌에 대한 공간이 확보되어 있지 않을 경우 공간 확보
         if interval not in candle_storage_for_symbol:
-            candle_storage_for_symbol[interval] = []
+            candle_storage_for_symbol[interval] = CandleSeries(self.candle_depth)
+        self.watched_intervals[exchange_id][symbol].add(interval)
+        self.update_base_interval(exchange_id, symbol)
+
+    # 캔들 캐시와 해당 캔들로 계산하는 지표 상태를 삭제함, 인터벌이 주어지지 않으면 종목의 모든 인터벌을 삭제함
+    def remove_candle_storage(self, exchange_id: int, symbol: str, interval: Interval = None):
+        if interval is None:
+            self.candles[exchange_id].pop(symbol, None)
+            self.watched_intervals[exchange_id].pop(symbol, None)
+            self.base_intervals[exchange_id].pop(symbol, None)
+            self.next_rollover_timestamps.pop((exchange_id, symbol), None)
+            self.rsi_states[exchange_id].pop(symbol, None)
+            self.bollinger_band_states[exchange_id].pop(symbol, None)
+            return
+        self.watched_intervals[exchange_id].get(symbol, set()).discard(interval)
+        self.update_base_interval(exchange_id, symbol)
+        # 감시하지 않는 인터벌이어도 기준 인터벌이면 캔들 캐시를 유지함
+        if interval != self.base_intervals[exchange_id].get(symbol):
+            self.candles[exchange_id].get(symbol, {}).pop(interval, None)
+        self.rsi_states[exchange_id].get(symbol, {}).pop(interval, None)
+        self.bollinger_band_states[exchange_id].get(symbol, {}).pop(interval, None)
+
+    # 감시하는 인터벌이 바뀌었을 때 종목의 기준 인터벌을 다시 정함
+    def update_base_interval(self, exchange_id: int, symbol: str):
+        watched_intervals = self.watched_intervals[exchange_id].get(symbol)
+        if not watched_intervals:
+            self.base_intervals[exchange_id].pop(symbol, None)
+            self.next_rollover_timestamps.pop((exchange_id, symbol), None)
+            return
+        base_interval = Interval.from_second(reduce(gcd, (interval.to_second for interval in watched_intervals)))
+        old_base_interval = self.base_intervals[exchange_id].get(symbol)
+        if base_interval == old_base_interval:
+            return
+        candle_storage_for_symbol = self.candles[exchange_id][symbol]
+        if old_base_interval is not None:
+            old_base_candle = self.get_last_candle(exchange_id, symbol, old_base_interval)
+            # 기준 인터벌이 길어지는 경우, 이전 기준 캔들에 쌓인 거래를 더 긴 인터벌의 진행 중인 캔들에 반영함
+            if old_base_candle is not None and base_interval > old_base_interval:
+                for interval, candle_series in candle_storage_for_symbol.items():
+                    if interval > old_base_interval:
+                        self.roll_up_candle(candle_series, old_base_candle)
+            # 감시하지 않는 인터벌이었다면 이전 기준 캔들 캐시를 삭제함
+            if old_base_interval not in watched_intervals:
+                candle_storage_for_symbol.pop(old_base_interval, None)
+        self.base_intervals[exchange_id][symbol] = base_interval
+        # 감시하지 않는 인터벌이 기준 인터벌이 된 경우 현재 시간의 빈 캔들부터 거래를 쌓음
+        if base_interval not in candle_storage_for_symbol:
+            candle_series = CandleSeries(self.candle_depth)
+            current_timestamp = int(self.exchange_time(exchange_id))
+            current_timestamp -= current_timestamp % base_interval.to_second
+            candle_series.append(Candle(exchange_id, symbol, datetime.fromtimestamp(current_timestamp), base_interval))
+            candle_storage_for_symbol[base_interval] = candle_series
+        self.schedule_rollover(exchange_id, symbol)
+
+    # 거래소의 현재 시각을 로컬 시각과 측정한 시각 차이로 추정함
+    def exchange_time(self, exchange_id: int) -> float:
+        return self.clock() - self.clock_offsets[exchange_id].value
+
+    # 로컬 시각과 거래소 시각의 차이(초)를 반환함
+    def get_clock_offset(self, exchange_id: int) -> float:
+        return self.clock_offsets[exchange_id].value
+
+    # 종목의 기준 캔들이 다음으로 마감되는 거래소 시각을 예약함
+    def schedule_rollover(self, exchange_id: int, symbol: str, timestamp: int = None):
+        if timestamp is None:
+            base_second = self.base_intervals[exchange_id][symbol].to_second
+            current_timestamp = int(self.exchange_time(exchange_id))
+            timestamp = current_timestamp - current_timestamp % base_second + base_second
+        self.next_rollover_timestamps[(exchange_id, symbol)] = timestamp
+        rollover_schedule = self.rollover_schedules[exchange_id]
+        heapq.heappush(rollover_schedule, (timestamp, symbol))
+        # 가장 이른 예약이 바뀌었으면 대기 중인 태스크를 깨움
+        if rollover_schedule[0][0] == timestamp and self.rollover_schedule_changed is not None:
+            self.rollover_schedule_changed.set()
+
+    # 마감된 기준 캔들을 같은 기간에 속한 더 긴 인터벌의 진행 중인 캔들에 합침
+    @staticmethod
+    def roll_up_candle(candle_series: CandleSeries, base_candle: Candle):
+        candle = candle_series.last
+        if candle is not None and candle.timestamp <= base_candle.timestamp < candle.time_limit:
+            candle.merge(base_candle)
+
+    # 마감된 캔들들의 종가로 RSI 상태를 새로 계산해 저장함
+    def seed_rsi_state(self, exchange_id: int, symbol: str, interval: Interval, length: int) -> RsiState:
+        states = self.rsi_states[exchange_id].setdefault(symbol, {}).setdefault(interval, {})
+        if length not in states:
+            states[length] = RsiState(length)
+        # 마지막 캔들은 아직 진행 중인 캔들이므로 제외함
+        closes = [candle.close for candle in self.get_candles(exchange_id, symbol, interval)[:-1]]
+        states[length].seed(closes)
+        return states[length]
+
+    # RSI 상태를 반환함, 상태가 없으면 캐시된 캔들로 새로 계산함
+    def get_rsi_state(self, exchange_id: int, symbol: str, interval: Interval, length: int) -> RsiState:
+        try:
+            return self.rsi_states[exchange_id][symbol][interval][length]
+        except KeyError:
+            return self.seed_rsi_state(exchange_id, symbol, interval, length)
+
+    # 마감된 캔들들의 종가로 볼린저 밴드 상태를 새로 계산해 저장함
+    def seed_bollinger_band_state(self, exchange_id: int, symbol: str, interval: Interval,
+                                  length: int) -> BollingerBandState:
+        states = self.bollinger_band_states[exchange_id].setdefault(symbol, {}).setdefault(interval, {})
+        if length not in states:
+            states[length] = BollingerBandState(length)
+        # 마지막 캔들은 아직 진행 중인 캔들이므로 제외함
+        closes = [candle.close for candle in self.get_candles(exchange_id, symbol, interval)[:-1]]
+        states[length].seed(closes)
+        return states[length]
+
+    # 볼린저 밴드 상태를 반환함, 상태가 없으면 캐시된 캔들로 새로 계산함
+    def get_bollinger_band_state(self, exchange_id: int, symbol: str, interval: Interval,
+                                 length: int) -> BollingerBandState:
+        try:
+            return self.bollinger_band_states[exchange_id][symbol][interval][length]
+        except KeyError:
+            return self.seed_bollinger_band_state(exchange_id, symbol, interval, length)
+
+    # 캐시된 캔들로 해당 인터벌의 모든 지표 상태를 새로 계산함
+    def seed_indicators(self, exchange_id: int, symbol: str, interval: Interval):
+        for length in list(self.rsi_states[exchange_id].get(symbol, {}).get(interval, {})):
+            self.seed_rsi_state(exchange_id, symbol, interval, length)
+        for length in list(self.bollinger_band_states[exchange_id].get(symbol, {}).get(interval, {})):
+            self.seed_bollinger_band_state(exchange_id, symbol, interval, length)
+
+    # 캔들이 마감되었을 때 해당 캔들로 계산하는 지표 상태를 갱신함
+    def update_indicators(self, exchange_id: int, symbol: str, interval: Interval, close: float):
+        rsi_states = self.rsi_states[exchange_id].get(symbol, {}).get(interval, {})
+        for rsi_state in rsi_states.values():
+            rsi_state.update(close)
+        bollinger_band_states = self.bollinger_band_states[exchange_id].get(symbol, {}).get(interval, {})
+        for bollinger_band_state in bollinger_band_states.values():
+            bollinger_band_state.update(close)
 
     # 호가 캐시 공간 확보
     def create_order_book_storage(self, exchange_id: int, symbol: str):
@@ -43,102 +241,218 @@ class Cache:
     def cache_order_book(self, order_book: OrderBook, exchange_id: int, symbol: str):
         storage = self.order_books[exchange_id]
         storage[symbol] = order_book
+        # 호가 버전 갱신
+        versions = self.order_book_versions[exchange_id]
+        versions[symbol] = versions.get(symbol, 0) + 1
+
+    # 종목의 호가 캐시와 고래 인덱스, 호가 버전을 삭제함
+    # 호가 버전을 남겨두면 다시 등록할 때 이미 호가를 받고 있는 것으로 판단하므로 함께 삭제함
+    def remove_order_book(self, exchange_id: int, symbol: str):
+        self.order_books[exchange_id].pop(symbol, None)
+        self.whale_indexes[exchange_id].pop(symbol, None)
+        self.order_book_versions[exchange_id].pop(symbol, None)
+
+    # 종목에 실제 호가가 캐시되어 있는지 여부를 반환함, 공간만 확보된 경우 False
+    def has_order_book(self, exchange_id: int, symbol: str) -> bool:
+        return isinstance(self.order_books[exchange_id].get(symbol), dict)
+
+    # 종목의 현재 호가 버전을 반환함, 호가가 한 번도 캐시되지 않았으면 0을 반환함
+    def get_order_book_version(self, exchange_id: int, symbol: str) -> int:
+        return self.order_book_versions[exchange_id].get(symbol, 0)
+
+    # 현재 호가 버전에 대한 고래 인덱스를 반환함, 호가가 바뀐 경우에만 인덱스를 새로 만듦
+    def get_whale_index(self, exchange_id: int, symbol: str) -> WhaleIndex:
+        version = self.get_order_book_version(exchange_id, symbol)
+        whale_indexes = self.whale_indexes[exchange_id]
+        whale_index = whale_indexes.get(symbol)
+        if whale_index is None or whale_index.version != version:
+            order_book: OrderBook = self.order_books[exchange_id][symbol]
+            whale_index = WhaleIndex(order_book, version)
+            whale_indexes[symbol] = whale_index
+        return whale_index
 
-    # 캔들에 거래를 캐시함
+    # 현재 호가에서 총액이 quantity 이상인 매수/매도 호가를 반환함
+    def get_whales(self, exchange_id: int, symbol: str,
+                   quantity: float) -> Tuple[List[List[float]], List[List[float]]]:
+        return self.get_whale_index(exchange_id, symbol).find(quantity)
+
+    # 기준 인터벌의 진행 중인 캔들에 거래를 캐시함
+    # 거래 타임스탬프가 예약된 마감 시각을 지났으면 먼저 캔들을 마감함
     def cache_trade(self, trade: Trade, exchange_id: int):
         symbol: str = trade['symbol'].split(':')[0]
-        if symbol not in self.candles[exchange_id]:
+        base_interval = self.base_intervals[exchange_id].get(symbol)
+        if base_interval is None:
             return
-        candle_cache: Dict[Interval, List[Candle]] = self.candles[exchange_id][symbol]
-        intervals: List[Interval] = list(candle_cache.keys())
+        if trade['timestamp'] is not None:
+            trade_timestamp = trade['timestamp'] / 1000
+            self.clock_offsets[exchange_id].add_sample(self.clock(), trade_timestamp)
+            self.run_due_rollover(exchange_id, symbol, trade_timestamp)
+        candle: Optional[Candle] = self.candles[exchange_id][symbol][base_interval].last
+        if candle is not None:
+            candle.add_trade(trade)
 
-        for interval in intervals:
-            if len(candle_cache[interval]) == 0:
+    # 과거 캔들 없이 시작하는 경우, 종목의 비어 있는 캔들 저장소에 현재 시각의 빈 캔들을 추가함
+    def start_candle_series(self, exchange_id: int, symbol: str):
+        current_timestamp = int(self.exchange_time(exchange_id))
+        for interval, candle_series in self.candles[exchange_id].get(symbol, {}).items():
+            if len(candle_series) > 0:
                 continue
-            candle: Candle = candle_cache[interval][-1]
-            candle.add_trade(trade)
+            start_timestamp = current_timestamp - current_timestamp % interval.to_second
+            candle_series.append(Candle(exchange_id, symbol, datetime.fromtimestamp(start_timestamp), interval))
+
+    # 해당 조건의 캔들 저장소를 반환함, 저장소가 없으면 None을 반환함
+    def get_candle_series(self, exchange_id: int, symbol: str, interval: Interval) -> Optional[CandleSeries]:
+        return self.candles[exchange_id].get(symbol, {}).get(interval)
 
     # 해당 조건에 부합하는 캔들 리스트를 불러옴
+    # since: 이 타임스탬프 이후에 시작한 캔들만 불러옴, limit: 이 타임스탬프 이전에 시작한 캔들만 불러옴
     def get_candles(self, exchange_id: int, symbol: str, interval: Interval, since: int = None,
                     limit: int = None) -> List[Candle]:
-        if symbol not in self.candles[exchange_id]:
+        candle_series = self.get_candle_series(exchange_id, symbol, interval)
+        if candle_series is None:
             return []
+        return candle_series.range(since, limit)
 
-        if interval not in self.candles[exchange_id][symbol]:
-            return []
+    # 캐시된 캔들 저장소 개수를 반환함
+    def candle_series_count(self) -> int:
+        return sum(len(symbol_storage) for exchange_storage in self.candles.values()
+                   for symbol_storage in exchange_storage.values())
+
+    # 캔들과 호가 캐시가 차지하는 메모리를 바이트 단위로 어림잡아 반환함
+    # 캔들은 모두 같은 크기의 __slots__ 객체이므로 저장소마다 캔들 하나의 크기에 개수를 곱해 계산함
+    def estimate_memory(self) -> int:
+        memory = 0
+        for exchange_storage in self.candles.values():
+            for symbol_storage in exchange_storage.values():
+                for candle_series in symbol_storage.values():
+                    memory += sys.getsizeof(candle_series.slots) + sys.getsizeof(candle_series.timestamps)
+                    last_candle = candle_series.last
+                    if last_candle is not None:
+                        memory += len(candle_series) * (sys.getsizeof(last_candle)
+                                                        + sys.getsizeof(last_candle.datetime))
+        for exchange_storage in self.order_books.values():
+            for order_book in exchange_storage.values():
+                for side in ('bids', 'asks'):
+                    levels = order_book.get(side, []) if isinstance(order_book, dict) else []
+                    memory += sys.getsizeof(levels)
+                    if levels:
+                        memory += len(levels) * sys.getsizeof(levels[0])
+        return memory
+
+    # 과거 캔들이 현재 캔들까지 빈 구간 없이 채워져 있는지 여부를 반환함
+    def is_candle_series_warm(self, exchange_id: int, symbol: str, interval: Interval) -> bool:
+        candle_series = self.get_candle_series(exchange_id, symbol, interval)
+        # 진행 중인 캔들 외에 마감된 캔들이 있어야 함
+        if candle_series is None or len(candle_series) < 2:
+            return False
+        # 스냅샷에서 불러온 캔들처럼 마지막 캔들이 이미 마감되었다면 이후 구간을 불러와야 함
+        return candle_series.last.time_limit > self.exchange_time(exchange_id)
 
-        candles = self.candles[exchange_id][symbol][interval]
-        if since is not None:
-            candles = [candle for candle in candles if candle.datetime.timestamp() >= since]
-        if limit is not None:
-            candles = [candle for candle in candles if candle.datetime.timestamp() < limit]
-        return candles
+    # 해당 조건의 가장 최근 캔들을 반환함, 캔들이 없으면 None을 반환함
+    def get_last_candle(self, exchange_id: int, symbol: str, interval: Interval) -> Optional[Candle]:
+        candle_series = self.get_candle_series(exchange_id, symbol, interval)
+        if candle_series is None:
+            return None
+        return candle_series.last
 
     # 이미 캔들이 존재하는지 여부를 반환함
     def is_candle_exists(self, candle: Candle):
-        exchange_id = candle.exchange_id
-        symbol = candle.symbol
-        interval = candle.interval
-        # 같은 조건(거래소, 종목, 인터벌)의 캔들 리스트를 불러옴
-        candles = self.get_candles(exchange_id, symbol, interval)
-        # 불러온 캔들들의 타임스탬프 리스트
-        timestamps = [_candle.datetime.timestamp() for _candle in candles]
-        # 검색하는 캔들의 타임스탬프
-        candle_timestamp = candle.datetime.timestamp()
-        # 같은 타임스탬프가 리스트에 존재하는지 여부를 반환함
-        return candle_timestamp in timestamps
-
-    # 캔들을 리스트에 추가함
+        candle_series = self.get_candle_series(candle.exchange_id, candle.symbol, candle.interval)
+        return candle_series is not None and candle.timestamp in candle_series
+
+    # 캔들을 저장소에 추가함, 같은 시각의 캔들이 이미 존재하면 추가하지 않음
     def add_candle(self, candle: Candle):
-        exchange_id = candle.exchange_id
-        symbol = candle.symbol
-        interval = candle.interval
-        # 해당 캔들이 존재하는 경우 캔들을 추가하지 않고 리턴
-        if self.is_candle_exists(candle):
+        candle_series = self.candles[candle.exchange_id][candle.symbol][candle.interval]
+        return candle_series.append(candle)
+
+    # 과거 데이터로 받은 캔들을 저장함, 같은 시각에 거래 없이 이전 종가로 채워 둔 캔들이 있으면 받은 값으로 바꿈
+    # 스냅샷을 불러온 뒤 빈 구간을 받아오는 동안 마감된 캔들이 스냅샷의 오래된 종가로 남지 않게 함
+    def add_backfilled_candle(self, candle: Candle) -> bool:
+        candle_series = self.candles[candle.exchange_id][candle.symbol][candle.interval]
+        placeholder = candle_series.get(candle.timestamp)
+        if placeholder is None:
+            return candle_series.append(candle)
+        if placeholder.trade_count > 0:
             return False
-        candle_storage: List[Candle] = self.candles[exchange_id][symbol][interval]
-        if len(candle_storage) >= 100:
-            candle_storage.pop(0)
-        candle_storage.append(candle)
+        placeholder.open = candle.open
+        placeholder.high = candle.high
+        placeholder.low = candle.low
+        placeholder.close = candle.close
+        placeholder.volume = candle.volume
         return True
 
-    # 현재 시간에 해당하는 새로운 캔들을 생성해 저장함
-    def build_new_candle(self):
-        for exchange_id in self.candles:
-            symbol_cache = self.candles[exchange_id]
-            for symbol in symbol_cache:
-                interval_cache: Dict[Interval, List[Candle]] = symbol_cache[symbol]
-                for interval in interval_cache:
-                    current_datetime: datetime = datetime.now().replace(microsecond=0)
-                    current_timestamp: int = int(current_datetime.timestamp())
-                    # 현재 타임스탬프가 인터벌의 초 길이로 나누어 떨어지면 새 캔들을 생성
-                    if current_timestamp % interval.to_second != 0:
-                        continue
-                    # 공간 확보를 위해 기록이 끝난 캔들의 거래 정보를 삭제함
-                    try:
-                        last_candle = self.get_candles(exchange_id, symbol, interval)[-1]
-                    except IndexError:
-                        continue
-                    last_candle.clear_trade()
-                    # 새 캔들을 생성하고 캐시
-                    new_candle = Candle(exchange_id, symbol, current_datetime, interval)
-                    # 새 캔들이 생성된 직후에는 모든 값을 전 캔들의 종가로 지정
-                    new_candle.open = last_candle.close
-                    new_candle.low = last_candle.close
-                    new_candle.high = last_candle.high
-                    new_candle.close = last_candle.close
-                    self.add_candle(new_candle)
-
-    # 일정 시간마다 시간을 확인하고 새 캔들을 추가하는 태스크
-    async def candle_update_task(self, period: float):
-        # 마지막으로 확인한 시간의 초
-        last_check_second = datetime.now().second
+    # timestamp 시각에 마감되는 종목의 캔들들을 마감하고 새 캔들을 생성해 저장함
+    def build_new_candle(self, exchange_id: int, symbol: str, timestamp: int):
+        interval_cache: Dict[Interval, CandleSeries] = self.candles[exchange_id][symbol]
+        base_interval = self.base_intervals[exchange_id][symbol]
+        current_datetime = datetime.fromtimestamp(timestamp)
+        base_candle = self.get_last_candle(exchange_id, symbol, base_interval)
+        for interval, candle_series in interval_cache.items():
+            # 마감된 기준 캔들을 더 긴 인터벌의 진행 중인 캔들에 합침
+            if interval != base_interval and base_candle is not None:
+                self.roll_up_candle(candle_series, base_candle)
+            # 모든 인터벌은 기준 인터벌의 배수이므로 마감 시각이 인터벌의 초 길이로 나누어 떨어지는 캔들만 마감함
+            if timestamp % interval.to_second == 0:
+                self.open_new_candle(exchange_id, symbol, interval, current_datetime)
+
+    # 마지막 캔들을 마감하고 이어지는 새 캔들을 추가함
+    def open_new_candle(self, exchange_id: int, symbol: str, interval: Interval, current_datetime: datetime):
+        last_candle = self.get_last_candle(exchange_id, symbol, interval)
+        # 이미 해당 시각 이후의 캔들이 있으면(과거 데이터로 채워진 경우) 새 캔들을 만들지 않음
+        if last_candle is None or last_candle.timestamp >= current_datetime.timestamp():
+            return
+        # 새 캔들을 생성하고 캐시
+        new_candle = Candle(exchange_id, symbol, current_datetime, interval)
+        # 새 캔들이 생성된 직후에는 모든 값을 전 캔들의 종가로 지정
+        new_candle.open = last_candle.close
+        new_candle.low = last_candle.close
+        new_candle.high = last_candle.close
+        new_candle.close = last_candle.close
+        # 거래가 한 번도 없었던 캔들은 종가가 없으므로 지표 상태를 갱신하지 않음
+        if self.add_candle(new_candle) and last_candle.close is not None:
+            # 마감된 캔들의 종가로 지표 상태 갱신
+            self.update_indicators(exchange_id, symbol, interval, last_candle.close)
+
+    # 종목의 예약된 마감 시각 중 거래소 시각 timestamp 이전의 마감을 순서대로 처리함
+    def run_due_rollover(self, exchange_id: int, symbol: str, timestamp: float):
+        key = (exchange_id, symbol)
+        rollover_timestamp = self.next_rollover_timestamps.get(key)
+        while rollover_timestamp is not None and rollover_timestamp <= timestamp:
+            self.build_new_candle(exchange_id, symbol, rollover_timestamp)
+            base_second = self.base_intervals[exchange_id][symbol].to_second
+            self.schedule_rollover(exchange_id, symbol, rollover_timestamp + base_second)
+            rollover_timestamp = self.next_rollover_timestamps[key]
+
+    # 거래가 없어 아직 마감되지 않은 종목 중 마감 시각이 rollover_delay초 이상 지난 종목의 캔들을 마감함
+    # 태스크가 늦게 깨어나 여러 마감 시각을 지나친 경우에도 지나친 마감을 빠짐없이 순서대로 처리함
+    def run_due_rollovers(self, exchange_id: int, exchange_timestamp: float):
+        rollover_schedule = self.rollover_schedules[exchange_id]
+        due_timestamp = exchange_timestamp - self.rollover_delay
+        while rollover_schedule and rollover_schedule[0][0] <= due_timestamp:
+            timestamp, symbol = heapq.heappop(rollover_schedule)
+            # 취소되었거나 거래로 이미 마감된 예약은 무시함
+            if self.next_rollover_timestamps.get((exchange_id, symbol)) != timestamp:
+                continue
+            self.run_due_rollover(exchange_id, symbol, due_timestamp)
+
+    # 가장 이른 마감 시각까지 기다렸다가 거래가 없는 종목의 캔들을 마감하는 태스크
+    async def candle_update_task(self):
+        self.rollover_schedule_changed = asyncio.Event()
         while True:
-            current_second = datetime.now().second
-            if last_check_second != current_second:
-                self.build_new_candle()
-            last_check_second = current_second
-            await asyncio.sleep(period)
+            delay = None
+            for exchange_id, rollover_schedule in self.rollover_schedules.items():
+                self.run_due_rollovers(exchange_id, self.exchange_time(exchange_id))
+                if not rollover_schedule:
+                    continue
+                # 거래소 시각으로 예약된 마감 시각까지 남은 로컬 시간
+                exchange_delay = rollover_schedule[0][0] + self.rollover_delay - self.exchange_time(exchange_id)
+                delay = exchange_delay if delay is None else min(delay, exchange_delay)
+            self.rollover_schedule_changed.clear()
+            # 예약이 없으면 새 예약이 생길 때까지 기다림
+            try:
+                await asyncio.wait_for(self.rollover_schedule_changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
 
     @staticmethod
     def merge_candle(candles: List[Candle], target_interval: Interval):
@@ -146,7 +460,7 @@ class Cache:
         symbol = candles[0].symbol
         _datetime = candles[0].datetime
         new_candle = Candle(exchange_id, symbol, _datetime, target_interval)
-        # 주어진 캔들들의 거래를 new_candle의 거래 리스트에 추가함
+        # 주어진 캔들들을 순서대로 new_candle에 합침
         for candle in candles:
-            new_candle.trades += candle.trades
+            new_candle.merge(candle)
         return new_candle
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Set
+
+from ccxt import BaseError, ExchangeClosedByUser, NetworkError
+from ccxt.base.types import Trade, OrderBook
+
+
+class ExchangeConnection:
+    """
+    거래소 하나에 대한 웹소켓 연결을 관리함
+    하나의 ccxt.pro 클라이언트로 여러 종목을 묶어서 구독하고, 받은 거래/호가 정보를 종목별 큐로 나누어 전달함
+    """
+    # 한 번의 구독 요청으로 묶을 수 있는 최대 종목 수 (바이낸스 watch_trades_for_symbols 제한)
+    batch_size = 200
+    # 새로 구독한 종목을 모아서 한 번에 구독 요청을 보내기까지 기다리는 시간
+    batch_delay = 0.5
+    # 네트워크 오류가 아닌 거래소 오류가 발생했을 때 다시 구독하기까지 기다리는 시간
+    retry_delay = 1.0
+
+    def __init__(self, exchange_id: int, exchange_factory: Callable, order_book_limit: int = 20):
+        self.exchange_id = exchange_id
+        self.exchange_factory = exchange_factory
+        self.order_book_limit = order_book_limit
+        self.exchange = exchange_factory(exchange_id)
+        # 재연결할 때마다 증가하는 값, 여러 스트림이 동시에 재연결을 시도하는 것을 막음
+        self.generation = 0
+        self.reconnect_count = 0
+        # 종목별 구독 큐
+        self.trade_queues: Dict[str, asyncio.Queue] = {}
+        self.order_book_queues: Dict[str, asyncio.Queue] = {}
+        # 이미 스트림이 실행 중인 종목
+        self.streaming_trade_symbols: Set[str] = set()
+        self.streaming_order_book_symbols: Set[str] = set()
+        # 구독 요청을 기다리는 종목
+        self.pending_trade_symbols: List[str] = []
+        self.pending_order_book_symbols: List[str] = []
+
+    def has(self, feature: str) -> bool:
+        return bool(self.exchange.has.get(feature))
+
+    # 거래 정보를 받을 종목을 구독하고 해당 종목의 거래 큐를 반환함, 큐에는 (받은 시각, 거래 리스트)가 들어옴
+    def subscribe_trades(self, symbol: str) -> asyncio.Queue:
+        if symbol not in self.trade_queues:
+            self.trade_queues[symbol] = asyncio.Queue()
+        if symbol not in self.streaming_trade_symbols and symbol not in self.pending_trade_symbols:
+            self.pending_trade_symbols.append(symbol)
+            # 대기 중인 첫 종목일 경우 잠시 뒤 대기 중인 종목들을 묶어서 구독함
+            if len(self.pending_trade_symbols) == 1:
+                asyncio.get_event_loop().call_later(self.batch_delay, self.start_trade_streams)
+        return self.trade_queues[symbol]
+
+    def unsubscribe_trades(self, symbol: str):
+        self.trade_queues.pop(symbol, None)
+
+    # 호가 정보를 받을 종목을 구독하고 해당 종목의 호가 큐를 반환함
+    def subscribe_order_book(self, symbol: str) -> asyncio.Queue:
+        if symbol not in self.order_book_queues:
+            self.order_book_queues[symbol] = asyncio.Queue()
+        if symbol not in self.streaming_order_book_symbols and symbol not in self.pending_order_book_symbols:
+            self.pending_order_book_symbols.append(symbol)
+            if len(self.pending_order_book_symbols) == 1:
+                asyncio.get_event_loop().call_later(self.batch_delay, self.start_order_book_streams)
+        return self.order_book_queues[symbol]
+
+    def unsubscribe_order_book(self, symbol: str):
+        self.order_book_queues.pop(symbol, None)
+
+    # 대기 중인 종목들을 최대 batch_size 개씩 묶어 거래 스트림을 시작함
+    def start_trade_streams(self):
+        symbols = self.pending_trade_symbols
+        self.pending_trade_symbols = []
+        self.streaming_trade_symbols.update(symbols)
+        for batch in self.split_batches(symbols):
+            # 여러 종목 구독을 지원하지 않는 거래소(업비트)는 같은 클라이언트에서 종목마다 구독함
+            # 업비트 클라이언트는 구독 중인 모든 종목 코드를 하나의 구독 요청으로 묶어서 보냄
+            if self.has('watchTradesForSymbols'):
+                asyncio.ensure_future(self.trade_streaming_task(batch))
+            else:
+                for symbol in batch:
+                    asyncio.ensure_future(self.trade_streaming_task([symbol]))
+
+    # 대기 중인 종목들을 최대 batch_size 개씩 묶어 호가 스트림을 시작함
+    def start_order_book_streams(self):
+        symbols = self.pending_order_book_symbols
+        self.pending_order_book_symbols = []
+        self.streaming_order_book_symbols.update(symbols)
+        for batch in self.split_batches(symbols):
+            if self.has('watchOrderBookForSymbols'):
+                asyncio.ensure_future(self.order_book_streaming_task(batch))
+            else:
+                for symbol in batch:
+                    asyncio.ensure_future(self.order_book_streaming_task([symbol]))
+
+    def split_batches(self, symbols: List[str]) -> List[List[str]]:
+        return [symbols[index:index + self.batch_size] for index in range(0, len(symbols), self.batch_size)]
+
+    async def watch_trades(self, symbols: List[str]) -> List[Trade]:
+        if len(symbols) == 1:
+            return await self.exchange.watch_trades(symbols[0])
+        return await self.exchange.watch_trades_for_symbols(symbols)
+
+    async def watch_order_book(self, symbols: List[str]) -> OrderBook:
+        if len(symbols) == 1:
+            return await self.exchange.watch_order_book(symbols[0], limit=self.order_book_limit)
+        return await self.exchange.watch_order_book_for_symbols(symbols, limit=self.order_book_limit)
+
+    # 종목 묶음의 거래를 받아 종목별 큐로 전달하는 태스크
+    async def trade_streaming_task(self, symbols: List[str]):
+        try:
+            # 묶음의 모든 종목이 구독 해제되면 태스크 종료
+            while any(symbol in self.trade_queues for symbol in symbols):
+                generation = self.generation
+                try:
+                    trades: List[Trade] = await self.watch_trades(symbols)
+                except Exception as e:
+                    await self.handle_stream_error(e, generation, symbols)
+                    continue
+                if not trades:
+                    continue
+                received_at = time.time()
+                # 한 번에 받은 거래는 모두 같은 종목의 거래임
+                symbol: str = trades[0]['symbol'].split(':')[0]
+                trade_queue = self.trade_queues.get(symbol)
+                # 받은 시각과 함께 전달함
+                if trade_queue is not None:
+                    trade_queue.put_nowait((received_at, trades))
+        finally:
+            # 태스크가 어떤 이유로 끝나더라도 다시 구독하면 새 스트림이 시작되도록 함
+            self.streaming_trade_symbols.difference_update(symbols)
+
+    # 종목 묶음의 호가를 받아 종목별 큐로 전달하는 태스크
+    async def order_book_streaming_task(self, symbols: List[str]):
+        try:
+            while any(symbol in self.order_book_queues for symbol in symbols):
+                generation = self.generation
+                try:
+                    order_book: OrderBook = await self.watch_order_book(symbols)
+                except Exception as e:
+                    await self.handle_stream_error(e, generation, symbols)
+                    continue
+                symbol: str = order_book['symbol'].split(':')[0]
+                order_book_queue = self.order_book_queues.get(symbol)
+                # 호가가 갱신될 때마다 큐에 전달함
+                if order_book_queue is not None:
+                    order_book_queue.put_nowait(order_book)
+        finally:
+            self.streaming_order_book_symbols.difference_update(symbols)
+
+    async def handle_stream_error(self, error: Exception, generation: int, symbols: List[str]):
+        """
+        스트림에서 발생한 오류를 처리함, 처리할 수 없는 오류는 다시 발생시킴
+        :param error: Exception, 발생한 오류
+        :param generation: int, 구독을 요청할 때의 클라이언트 세대
+        :param symbols: List[str], 스트림의 종목 묶음
+        """
+        if isinstance(error, NetworkError):
+            await self.reconnect(generation)
+        elif isinstance(error, ExchangeClosedByUser):
+            # 다른 스트림이 재연결하면서 공유 클라이언트를 닫은 경우 새 클라이언트로 다시 구독함
+            if generation == self.generation:
+                await self.reconnect(generation)
+        elif isinstance(error, BaseError):
+            print(f"[{self.exchange_id}] {', '.join(symbols[:3])}{' 외' if len(symbols) > 3 else ''} 구독 오류: {error!r}")
+            await asyncio.sleep(self.retry_delay)
+        else:
+            raise error
+
+    # 거래소 연결 종료 후 재연결
+    async def reconnect(self, generation: int):
+        # 다른 스트림이 이미 재연결한 경우 새 클라이언트를 그대로 사용함
+        if generation != self.generation:
+            return
+        self.generation += 1
+        self.reconnect_count += 1
+        exchange = self.exchange
+        self.exchange = self.exchange_factory(self.exchange_id)
+        await exchange.close()
+
+    async def close(self):
+        self.trade_queues.clear()
+        self.order_book_queues.clear()
+        await self.exchange.close()
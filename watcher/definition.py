@@ -1,51 +1,14 @@
-from typing import Final, List, Optional, TypedDict
+from bisect import bisect_left
+from math import inf
+from typing import Dict, Final, List, Optional, Tuple
 from datetime import datetime
 
 from ccxt.base.types import Trade, OrderBook
 
-from database.definition import WhaleCondition, TickCondition, RsiCondition, BollingerBandCondition
-
 UPBIT_ID: Final[int] = 1
 BINANCE_ID: Final[int] = 2
 
 
-class WhaleInfo(TypedDict):
-    is_condition_none: bool
-    has_whale: Optional[bool]
-    whales_in_bids: List[List[float]]
-    whales_in_asks: List[List[float]]
-    order_book: OrderBook
-
-
-# 거래량 조건을 확인한 결과를 저장할 딕셔너리
-class TickInfo(TypedDict):
-    is_condition_none: bool
-    is_breakout: Optional[bool]
-    trade: Trade
-    condition: Optional[TickCondition]
-
-
-# RSI 조건을 확인한 결과를 저장할 딕셔너리
-class RsiInfo(TypedDict):
-    is_condition_none: bool
-    is_over_upper_bound: Optional[bool]
-    is_under_lower_bound: Optional[bool]
-    rsi: Optional[float]
-    trade: Trade
-    condition: Optional[RsiCondition]
-
-
-# 볼린저 밴드 조건을 확인한 결과를 저장할 딕셔너리
-class BollingerBandInfo(TypedDict):
-    is_condition_none: bool
-    is_over_upper_band: Optional[bool]
-    is_under_lower_band: Optional[bool]
-    upper_band: Optional[float]
-    lower_band: Optional[float]
-    trade: Trade
-    condition: Optional[BollingerBandCondition]
-
-
 # 인터벌
 class Interval:
     def __init__(self, length: int = None, timeframe: str = None, string: Optional[str] = None):
@@ -93,6 +56,14 @@ class Interval:
         second = self.length * interval_second_dict[self.timeframe]
         return second
 
+    # 초 단위 길이를 나누어 떨어지는 가장 긴 타임프레임의 인터벌로 변환
+    @staticmethod
+    def from_second(second: int) -> 'Interval':
+        for timeframe, timeframe_second in (('w', 604800), ('d', 86400), ('h', 3600), ('m', 60)):
+            if second % timeframe_second == 0:
+                return Interval(second // timeframe_second, timeframe)
+        return Interval(second, 's')
+
     @property
     def korean(self) -> str:
         timeframe_dict = {
@@ -109,74 +80,219 @@ class Interval:
         }
 
 
+# OHLCV 캔들, 거래를 저장하지 않고 거래가 추가될 때마다 시가/고가/저가/종가/거래량/거래 수를 갱신함
 class Candle:
+    __slots__ = ('exchange_id', 'symbol', 'datetime', 'timestamp', 'interval',
+                 'open', 'high', 'low', 'close', 'volume', 'trade_count')
+
     def __init__(self, exchange_id: int, symbol: str, _datetime: datetime, interval: Interval):
         self.exchange_id: int = exchange_id
         self.symbol: str = symbol
         self.datetime: datetime = _datetime
+        self.timestamp: int = int(_datetime.timestamp())    # 캔들 시작 시각의 초 단위 타임스탬프
         self.interval: Interval = interval
-        self.trades: List[Trade] = []
-        self._open: Optional[float] = None
-        self._high: Optional[float] = None
-        self._low: Optional[float] = None
-        self._close: Optional[float] = None
+        # 거래가 없는 동안에는 지정된 값(이전 캔들의 종가 등)을 유지하고, 첫 거래가 추가되면 거래 가격으로 덮어씀
+        self.open: Optional[float] = None
+        self.high: Optional[float] = None
+        self.low: Optional[float] = None
+        self.close: Optional[float] = None
+        self.volume: float = 0.0
+        self.trade_count: int = 0
 
     @property
-    def open(self) -> float:
-        if len(self.trades) == 0:
-            return self._open
-        first_trade = self.trades[0]
-        return first_trade['price']
+    def time_limit(self) -> int:
+        candle_interval_in_second = self.interval.to_second
+        return self.timestamp + candle_interval_in_second
 
+    def add_trade(self, trade: Trade):
+        price = trade['price']
+        if self.trade_count == 0:
+            self.open = self.high = self.low = price
+        elif price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += trade['amount']
+        self.trade_count += 1
+
+    # 같은 기간 안의 다음 캔들을 이 캔들에 합침
+    def merge(self, candle: 'Candle'):
+        if candle.open is None:
+            return
+        # 이 캔들에 거래가 없었다면 이전 캔들의 종가로 지정된 값 대신 합칠 캔들의 값을 사용함
+        if self.open is None or (self.trade_count == 0 and candle.trade_count > 0):
+            self.open, self.high, self.low = candle.open, candle.high, candle.low
+        else:
+            self.high = max(self.high, candle.high)
+            self.low = min(self.low, candle.low)
+        self.close = candle.close
+        self.volume += candle.volume
+        self.trade_count += candle.trade_count
+
+
+# 로컬 시각과 거래소 시각의 차이(로컬 시각 - 거래소 시각)를 거래의 타임스탬프로 추정함
+# 거래를 받은 시각과 거래 타임스탬프의 차이에는 네트워크 지연이 더해지므로 최근 window초 동안의 최솟값을 차이로 봄
+class ClockOffset:
+    __slots__ = ('window', 'window_start', 'current_minimum', 'previous_minimum')
+
+    def __init__(self, window: float = 60.0):
+        self.window: float = window
+        self.window_start: float = 0.0
+        self.current_minimum: float = inf     # 현재 구간의 최솟값
+        self.previous_minimum: float = inf    # 직전 구간의 최솟값
+
+    # 거래를 받은 로컬 시각과 거래 타임스탬프로 측정한 차이를 반영함
+    def add_sample(self, received_timestamp: float, exchange_timestamp: float):
+        if received_timestamp - self.window_start >= self.window:
+            self.window_start = received_timestamp
+            self.previous_minimum = self.current_minimum
+            self.current_minimum = inf
+        offset = received_timestamp - exchange_timestamp
+        if offset < self.current_minimum:
+            self.current_minimum = offset
+
+    # 추정한 시각 차이, 측정값이 없으면 0을 반환함
     @property
-    def high(self) -> float:
-        if len(self.trades) == 0:
-            return self._high
-        prices = [trade['price'] for trade in self.trades]
-        return max(prices)
+    def value(self) -> float:
+        offset = min(self.current_minimum, self.previous_minimum)
+        return 0.0 if offset == inf else offset
 
-    @property
-    def low(self) -> float:
-        if len(self.trades) == 0:
-            return self._low
-        prices = [trade['price'] for trade in self.trades]
-        return min(prices)
 
-    @property
-    def close(self) -> float:
-        if len(self.trades) == 0:
-            return self._close
-        last_trade = self.trades[-1]
-        return last_trade['price']
+# 같은 (거래소, 종목, 인터벌)의 캔들을 시간 순서대로 최대 capacity개까지 저장하는 링 버퍼
+# 캔들 추가와 중복 확인은 O(1), 타임스탬프 범위 검색은 O(log n)에 처리함
+class CandleSeries:
+    __slots__ = ('capacity', 'slots', 'start', 'size', 'timestamps')
 
-    @open.setter
-    def open(self, _open: float):
-        self._open = _open
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self.slots: List[Optional[Candle]] = [None] * capacity
+        self.start: int = 0     # 가장 오래된 캔들이 저장된 위치
+        self.size: int = 0
+        self.timestamps: Dict[int, Candle] = {}     # 타임스탬프별 캔들
 
-    @high.setter
-    def high(self, high: float):
-        self._high = high
+    def __len__(self) -> int:
+        return self.size
 
-    @low.setter
-    def low(self, low: float):
-        self._low = low
+    def __iter__(self):
+        for position in range(self.size):
+            yield self.slots[(self.start + position) % self.capacity]
 
-    @close.setter
-    def close(self, close: float):
-        self._close = close
+    def __getitem__(self, position: int) -> Candle:
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError('candle index out of range')
+        return self.slots[(self.start + position) % self.capacity]
 
-    @property
-    def time_limit(self) -> int:
-        candle_timestamp = int(self.datetime.timestamp())
-        candle_interval_in_second = self.interval.to_second
-        return candle_timestamp + candle_interval_in_second
+    def __contains__(self, timestamp: int) -> bool:
+        return timestamp in self.timestamps
 
-    def add_trade(self, trade: Trade):
-        self.trades.append(trade)
-
-    def clear_trade(self):
-        self._open = self.open
-        self._high = self.high
-        self._low = self.low
-        self._close = self.close
-        self.trades = []
+    # 해당 타임스탬프의 캔들을 반환함, 캔들이 없으면 None을 반환함
+    def get(self, timestamp: int) -> Optional[Candle]:
+        return self.timestamps.get(timestamp)
+
+    # 가장 최근 캔들을 반환함, 캔들이 없으면 None을 반환함
+    @property
+    def last(self) -> Optional[Candle]:
+        if self.size == 0:
+            return None
+        return self.slots[(self.start + self.size - 1) % self.capacity]
+
+    # 캔들을 추가하고 추가 여부를 반환함, 같은 타임스탬프의 캔들이 이미 있으면 추가하지 않음
+    def append(self, candle: Candle) -> bool:
+        if candle.timestamp in self.timestamps:
+            return False
+        last = self.last
+        # 가장 최근 캔들보다 이전 캔들은 위치를 찾아 끼워 넣음
+        if last is not None and candle.timestamp < last.timestamp:
+            return self.insert(candle)
+        # 버퍼가 가득 찬 경우 가장 오래된 캔들을 덮어씀
+        if self.size == self.capacity:
+            oldest = self.slots[self.start]
+            del self.timestamps[oldest.timestamp]
+            self.slots[self.start] = candle
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.slots[(self.start + self.size) % self.capacity] = candle
+            self.size += 1
+        self.timestamps[candle.timestamp] = candle
+        return True
+
+    # 중간에 빠진 캔들을 시간 순서에 맞게 끼워 넣음, 백필 중에만 드물게 일어나므로 O(n)으로 처리함
+    def insert(self, candle: Candle) -> bool:
+        position = self.bisect(candle.timestamp)
+        # 버퍼가 가득 찼는데 가장 오래된 캔들보다 이전 캔들이면 저장하지 않음
+        if position == 0 and self.size == self.capacity:
+            return False
+        candles = list(self)
+        candles.insert(position, candle)
+        self.clear()
+        for _candle in candles[-self.capacity:]:
+            self.append(_candle)
+        return True
+
+    def clear(self):
+        self.slots = [None] * self.capacity
+        self.start = 0
+        self.size = 0
+        self.timestamps = {}
+
+    # 타임스탬프가 timestamp 이상인 첫 캔들의 위치를 이진 탐색으로 찾음
+    def bisect(self, timestamp: int) -> int:
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.slots[(self.start + middle) % self.capacity].timestamp < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # 타임스탬프가 since 이상이고 until 미만인 캔들 리스트를 반환함
+    def range(self, since: Optional[int] = None, until: Optional[int] = None) -> List[Candle]:
+        first = 0 if since is None else self.bisect(since)
+        end = self.size if until is None else self.bisect(until)
+        return [self.slots[(self.start + position) % self.capacity] for position in range(first, end)]
+
+
+# 호가 한 버전에 대해 각 호가 단위의 총액(가격 x 수량)을 정렬해 둔 인덱스
+# 고래 조건(총액 >= quantity)에 해당하는 호가를 이진 탐색으로 찾고, 호가가 바뀔 때까지 결과를 재사용함
+class WhaleIndex:
+    __slots__ = ('version', 'bid_notionals', 'bid_positions', 'bids', 'ask_notionals', 'ask_positions', 'asks',
+                 'results')
+
+    def __init__(self, order_book: OrderBook, version: int):
+        self.version: int = version     # 인덱스를 만든 호가의 버전
+        self.bids: List[List[float]] = [[unit[0], unit[1]] for unit in order_book['bids']]
+        self.asks: List[List[float]] = [[unit[0], unit[1]] for unit in order_book['asks']]
+        self.bid_notionals, self.bid_positions = self.sort_by_notional(self.bids)
+        self.ask_notionals, self.ask_positions = self.sort_by_notional(self.asks)
+        # 고래 기준 총액별 검색 결과
+        self.results: Dict[float, Tuple[List[List[float]], List[List[float]]]] = {}
+
+    # 호가 단위들의 총액을 오름차순으로 정렬한 리스트와 각 총액에 해당하는 호가 단위의 위치 리스트를 반환함
+    @staticmethod
+    def sort_by_notional(units: List[List[float]]) -> Tuple[List[float], List[int]]:
+        entries = sorted((price * amount, position) for position, (price, amount) in enumerate(units))
+        notionals = [notional for notional, _ in entries]
+        positions = [position for _, position in entries]
+        return notionals, positions
+
+    # 총액이 quantity 이상인 호가 단위들을 원래 호가 순서대로 반환함
+    @staticmethod
+    def search(units: List[List[float]], notionals: List[float], positions: List[int],
+               quantity: float) -> List[List[float]]:
+        start = bisect_left(notionals, quantity)
+        return [units[position] for position in sorted(positions[start:])]
+
+    # 총액이 quantity 이상인 매수/매도 호가 단위를 반환함
+    # 반환된 리스트는 같은 기준을 사용하는 알람들이 공유하므로 수정하지 않아야 함
+    def find(self, quantity: float) -> Tuple[List[List[float]], List[List[float]]]:
+        result = self.results.get(quantity)
+        if result is None:
+            whales_in_bids = self.search(self.bids, self.bid_notionals, self.bid_positions, quantity)
+            whales_in_asks = self.search(self.asks, self.ask_notionals, self.ask_positions, quantity)
+            result = (whales_in_bids, whales_in_asks)
+            self.results[quantity] = result
+        return result
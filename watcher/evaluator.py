@@ -0,0 +1,157 @@
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from ccxt.base.types import Trade
+
+from database.definition import Condition
+from watcher.definition import Interval
+from watcher.indicator import RsiState, BollingerBandState
+
+if TYPE_CHECKING:
+    from watcher.cache import Cache
+
+
+# 알람의 조건을 미리 풀어서 저장해 두고 거래마다 조건을 검사하는 객체
+# 알람이 등록되거나 조건이 수정될 때 한 번만 생성되며, 알람이 울리는 경우에만 검사 결과 딕셔너리를 생성함
+class AlarmEvaluator:
+    __slots__ = ('exchange_id', 'symbol',
+                 'whale_quantity', 'tick_quantity',
+                 'rsi_interval', 'rsi_length', 'rsi_upper_bound', 'rsi_lower_bound',
+                 'bollinger_band_interval', 'bollinger_band_length', 'bollinger_band_coefficient',
+                 'on_over_upper_band', 'on_under_lower_band',
+                 'intervals', 'shortest_interval',
+                 'rsi_state', 'rsi_state_version', 'rsi_upper_price', 'rsi_lower_price',
+                 'bollinger_band_state', 'bollinger_band_state_version', 'bollinger_band_prices')
+
+    def __init__(self, exchange_id: int, symbol: str, condition: Condition):
+        self.exchange_id: int = exchange_id
+        self.symbol: str = symbol
+        # 고래 조건
+        whale_condition = condition['whale']
+        self.whale_quantity: Optional[float] = None if whale_condition is None else whale_condition['quantity']
+        # 거래 체결량 조건
+        tick_condition = condition['tick']
+        self.tick_quantity: Optional[float] = None if tick_condition is None else tick_condition['quantity']
+        # RSI 조건
+        rsi_condition = condition['rsi']
+        self.rsi_interval: Optional[Interval] = None
+        if rsi_condition is not None:
+            self.rsi_interval = Interval(**rsi_condition['interval'])
+            self.rsi_length: int = rsi_condition['length']
+            self.rsi_upper_bound: float = rsi_condition['upper_bound']
+            self.rsi_lower_bound: float = rsi_condition['lower_bound']
+        # 볼린저 밴드 조건
+        bollinger_band_condition = condition['bollinger_band']
+        self.bollinger_band_interval: Optional[Interval] = None
+        if bollinger_band_condition is not None:
+            self.bollinger_band_interval = Interval(**bollinger_band_condition['interval'])
+            self.bollinger_band_length: int = bollinger_band_condition['length']
+            self.bollinger_band_coefficient: float = bollinger_band_condition['coefficient']
+            self.on_over_upper_band: bool = bollinger_band_condition['on_over_upper_band']
+            self.on_under_lower_band: bool = bollinger_band_condition['on_under_lower_band']
+        # 조건으로 설정된 인터벌들
+        self.intervals: List[Interval] = []
+        for interval in (self.rsi_interval, self.bollinger_band_interval):
+            if interval is not None and interval not in self.intervals:
+                self.intervals.append(interval)
+        self.shortest_interval: Optional[Interval] = min(self.intervals) if self.intervals else None
+        # 지표 상태가 갱신될 때(캔들이 마감될 때)마다 한 번 계산해 두는 조건 돌파 가격
+        self.rsi_state: Optional[RsiState] = None
+        self.rsi_state_version: int = -1
+        self.rsi_upper_price: Optional[float] = None    # RSI가 상한 이상이 되는 최저 가격
+        self.rsi_lower_price: Optional[float] = None    # RSI가 하한 이하가 되는 최고 가격
+        self.bollinger_band_state: Optional[BollingerBandState] = None
+        self.bollinger_band_state_version: int = -1
+        # (상단선 이상이 되는 최저 가격, 하단선 이하가 되는 최고 가격)
+        self.bollinger_band_prices: Optional[Tuple[float, float]] = None
+
+    # RSI 상태를 불러오고, 상태가 갱신되었으면 조건을 돌파하는 가격을 다시 계산함
+    def load_rsi_state(self, cache: 'Cache') -> RsiState:
+        rsi_state = cache.get_rsi_state(self.exchange_id, self.symbol, self.rsi_interval, self.rsi_length)
+        if rsi_state is not self.rsi_state or rsi_state.version != self.rsi_state_version:
+            self.rsi_state = rsi_state
+            self.rsi_state_version = rsi_state.version
+            self.rsi_upper_price = rsi_state.upper_price(self.rsi_upper_bound)
+            self.rsi_lower_price = rsi_state.lower_price(self.rsi_lower_bound)
+        return rsi_state
+
+    # 볼린저 밴드 상태를 불러오고, 상태가 갱신되었으면 밴드를 돌파하는 가격을 다시 계산함
+    def load_bollinger_band_state(self, cache: 'Cache') -> BollingerBandState:
+        bollinger_band_state = cache.get_bollinger_band_state(self.exchange_id, self.symbol,
+                                                              self.bollinger_band_interval, self.bollinger_band_length)
+        if (bollinger_band_state is not self.bollinger_band_state
+                or bollinger_band_state.version != self.bollinger_band_state_version):
+            self.bollinger_band_state = bollinger_band_state
+            self.bollinger_band_state_version = bollinger_band_state.version
+            self.bollinger_band_prices = bollinger_band_state.band_prices(self.bollinger_band_coefficient)
+        return bollinger_band_state
+
+    # 거래 가격이 RSI 조건을 돌파하는지 여부를 반환함
+    def check_rsi(self, cache: 'Cache', price: float) -> bool:
+        self.load_rsi_state(cache)
+        # 마감된 캔들이 없는 경우
+        if self.rsi_upper_price is None:
+            return False
+        return price >= self.rsi_upper_price or price <= self.rsi_lower_price
+
+    # 거래 가격이 돌파한 볼린저 밴드 이름을 반환함, 돌파한 밴드가 없으면 None을 반환함
+    def check_bollinger_band(self, cache: 'Cache', price: float) -> Optional[str]:
+        bollinger_band_state = self.load_bollinger_band_state(cache)
+        if self.bollinger_band_prices is not None:
+            upper_price, lower_price = self.bollinger_band_prices
+            is_over_upper_band = price >= upper_price
+            is_under_lower_band = price <= lower_price
+        # 돌파 가격을 하나로 나타낼 수 없는 경우 밴드를 직접 계산함
+        else:
+            basis_band, upper_band, lower_band = bollinger_band_state.band(price, self.bollinger_band_coefficient)
+            is_over_upper_band = upper_band <= price
+            is_under_lower_band = lower_band >= price
+        crossed_band = None
+        # 상단선 돌파 시 알람 여부와 상단선 돌파 여부가 모두 참일 경우
+        if self.on_over_upper_band and is_over_upper_band:
+            crossed_band = 'upper_band'
+        # 하단선 돌파 시 알람 여부와 하단선 돌파 여부가 모두 참일 경우
+        if self.on_under_lower_band and is_under_lower_band:
+            crossed_band = 'lower_band'
+        return crossed_band
+
+    def evaluate(self, cache: 'Cache', trade: Trade) -> Optional[dict]:
+        """
+        거래가 알람 조건을 모두 만족하는지 검사함
+        :param cache: Cache, 호가와 캔들이 저장된 캐시
+        :param trade: Trade, 검사할 거래
+        :return: Optional[dict], 알람 조건을 모두 만족하면 검사 결과 딕셔너리, 아니면 None
+        """
+        # 지정된 고래 조건이 있을 경우 검사
+        whales_in_bids = whales_in_asks = None
+        if self.whale_quantity is not None:
+            whales_in_bids, whales_in_asks = cache.get_whales(self.exchange_id, self.symbol, self.whale_quantity)
+            # 발견된 고래가 없을 경우 검사 종료
+            if not (whales_in_bids or whales_in_asks):
+                return None
+        # 지정된 거래량 조건이 있을 경우 검사
+        if self.tick_quantity is not None and trade['amount'] < self.tick_quantity:
+            return None
+        # 지정된 RSI 조건이 있을 경우 검사
+        # 캔들 안에서는 거래 가격만 바뀌므로 캔들이 마감될 때 구해 둔 돌파 가격과 비교함
+        price = trade['price']
+        if self.rsi_interval is not None and not self.check_rsi(cache, price):
+            return None
+        # 지정된 볼린저 밴드 조건이 있을 경우 검사
+        crossed_band = None
+        if self.bollinger_band_interval is not None:
+            crossed_band = self.check_bollinger_band(cache, price)
+            # 돌파한 밴드가 없을 경우 검사 종료
+            if crossed_band is None:
+                return None
+        # 알람이 울리는 경우에만 알림에 표시할 RSI 값을 계산함
+        rsi_value = None if self.rsi_interval is None else self.rsi_state.value(price)
+        # 검사를 모두 통과한 경우에만 검사 결과를 생성함
+        return {
+            # 발견한 고래, 지정된 고래 조건이 있을 경우에만 값이 있음
+            'whales': None if whales_in_bids is None else {'bids': whales_in_bids, 'asks': whales_in_asks},
+            # RSI 값, 지정된 RSI 조건이 있을 경우에만 값이 있음
+            'rsi': rsi_value,
+            # 돌파한 볼린저 밴드 이름 (상단선 돌파 시: 'upper_band', 하단선 돌파 시: 'lower_band')
+            'crossed_band': crossed_band,
+            'trade': trade  # 검사한 거래 정보
+        }
@@ -0,0 +1,108 @@
+# 부하 테스트용 가짜 거래소
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional
+
+from ccxt.base.types import Trade, OrderBook
+
+from watcher.definition import Interval
+
+
+class FakeExchange:
+    """
+    Watcher가 사용하는 ccxt.pro 거래소 메서드만 흉내 내는 프로세스 내부 거래소
+    종목마다 랜덤 워크로 움직이는 가격을 만들고, 종목당 trade_rate개/초의 거래와 order_book_rate개/초의 호가를 생성함
+    """
+    has = {
+        'watchTradesForSymbols': True,
+        'watchOrderBookForSymbols': True
+    }
+
+    def __init__(self, trade_rate: float = 10.0, order_book_rate: float = 2.0, volatility: float = 0.0005,
+                 start_price: float = 100.0, seed: Optional[int] = None):
+        self.trade_rate = trade_rate
+        self.order_book_rate = order_book_rate
+        self.volatility = volatility
+        self.start_price = start_price
+        self.random = random.Random(seed)
+        self.prices: Dict[str, float] = {}
+        # 종목별 마지막으로 생성한 호가
+        self.orderbooks: Dict[str, OrderBook] = {}
+        self.timeframes: Dict[str, str] = {}
+        self.closed = False
+
+    def get_price(self, symbol: str) -> float:
+        if symbol not in self.prices:
+            self.prices[symbol] = self.start_price
+        return self.prices[symbol]
+
+    # 종목의 가격을 한 걸음 움직인 뒤 새 가격을 반환함
+    def step_price(self, symbol: str) -> float:
+        price = self.get_price(symbol) * (1 + self.random.gauss(0, self.volatility))
+        self.prices[symbol] = price
+        return price
+
+    def make_trade(self, symbol: str) -> Trade:
+        price = self.step_price(symbol)
+        amount = self.random.expovariate(1.0)
+        return {
+            'symbol': symbol,
+            'timestamp': int(time.time() * 1000),
+            'price': price,
+            'amount': amount,
+            'cost': price * amount,
+            'side': self.random.choice(('buy', 'sell'))
+        }
+
+    def make_order_book(self, symbol: str, limit: int = 20) -> OrderBook:
+        price = self.get_price(symbol)
+        tick = price * 0.0005
+        order_book = {
+            'symbol': symbol,
+            'timestamp': int(time.time() * 1000),
+            'bids': [[price - tick * level, self.random.expovariate(0.2)] for level in range(1, limit + 1)],
+            'asks': [[price + tick * level, self.random.expovariate(0.2)] for level in range(1, limit + 1)]
+        }
+        self.orderbooks[symbol] = order_book
+        return order_book
+
+    # 여러 종목을 구독하면 각 종목의 거래가 섞여서 도착하는 것처럼 묶음 전체의 거래 빈도로 기다린 뒤 한 종목의 거래를 반환함
+    async def watch_trades_for_symbols(self, symbols: List[str]) -> List[Trade]:
+        await asyncio.sleep(self.random.expovariate(self.trade_rate * len(symbols)))
+        return [self.make_trade(self.random.choice(symbols))]
+
+    async def watch_trades(self, symbol: str) -> List[Trade]:
+        return await self.watch_trades_for_symbols([symbol])
+
+    async def watch_order_book_for_symbols(self, symbols: List[str], limit: int = 20) -> OrderBook:
+        await asyncio.sleep(self.random.expovariate(self.order_book_rate * len(symbols)))
+        return self.make_order_book(self.random.choice(symbols), limit)
+
+    async def watch_order_book(self, symbol: str, limit: int = 20) -> OrderBook:
+        return await self.watch_order_book_for_symbols([symbol], limit)
+
+    # 현재 가격에서 거꾸로 걸어간 랜덤 워크로 과거 캔들을 만듦
+    async def fetch_ohlcv(self, symbol: str, timeframe: str = '1m', since: Optional[int] = None,
+                          limit: int = 100) -> List[list]:
+        interval_second = Interval(string=timeframe).to_second
+        current_timestamp = int(time.time())
+        end_timestamp = current_timestamp - current_timestamp % interval_second
+        start_timestamp = end_timestamp - interval_second * (limit - 1)
+        if since is not None:
+            start_timestamp = max(start_timestamp, since // 1000 - since // 1000 % interval_second)
+        close = self.get_price(symbol)
+        candles = []
+        for timestamp in range(end_timestamp, start_timestamp - 1, -interval_second):
+            open_price = close * (1 + self.random.gauss(0, self.volatility * 10))
+            high = max(open_price, close) * (1 + abs(self.random.gauss(0, self.volatility)))
+            low = min(open_price, close) * (1 - abs(self.random.gauss(0, self.volatility)))
+            candles.append([timestamp * 1000, open_price, high, low, close, self.random.expovariate(0.01)])
+            close = open_price
+        return candles[::-1]
+
+    async def fetch_order_book(self, symbol: str, limit: int = 20) -> OrderBook:
+        return self.make_order_book(symbol, limit)
+
+    async def close(self):
+        self.closed = True
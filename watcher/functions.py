@@ -1,8 +1,6 @@
+from math import fsum, sqrt
 from typing import List
 
-from statistics import mean as sma
-from statistics import pstdev
-
 
 PRICE, AMOUNT = 0, 1
 ORDER_TYPE_LIST = ['bids', 'asks']  # [매수, 매도]
@@ -37,32 +35,26 @@ def verify_new_whale(past_order_book: dict, current_whale_dict: dict, quantity:
 # 지수이동평균(EMA) 계산
 def ema(data: List[float], length) -> float:
     alpha = 2 / (1 + length)
+    value = data[0]
+    for x in data[1:]:
+        value = (alpha * x) + ((1 - alpha) * value)
+    return value
 
-    def f(t: int):
-        if t == 1:
-            return data[t - 1]
-        
-        return (alpha * data[t - 1]) + ((1 - alpha) * f(t - 1))
-
-    return f(len(data))
 
-
-# alpha 값이 1 / length 인 EMA 계산
+# alpha 값이 1 / length 인 EMA(와일더 이동평균) 계산, 처음 length개 값의 단순 평균에서 시작함
 def rma(data: List[float], length) -> float:
     alpha = 1 / length
-
-    def f(t: int):
-        if t == 1:
-            return sma(data)
-        return (data[t - 1] * alpha) + (f(t - 1) * (1 - alpha))
-
-    return f(len(data))
+    seed = data[:length]
+    value = sum(seed) / len(seed)
+    for x in data[length:]:
+        value = (x * alpha) + (value * (1 - alpha))
+    return value
 
 
 # 볼린저 밴드 계산
 def bollinger_band(closing_price_list: List[float], k=2.0):
-    basis_band = sma(closing_price_list)
-    stdev_value = pstdev(closing_price_list)
+    basis_band = fsum(closing_price_list) / len(closing_price_list)
+    stdev_value = sqrt(fsum((price - basis_band) ** 2 for price in closing_price_list) / len(closing_price_list))
 
     upper_band = basis_band + (stdev_value * k)
     lower_band = basis_band - (stdev_value * k)
@@ -70,6 +62,14 @@ def bollinger_band(closing_price_list: List[float], k=2.0):
     return basis_band, upper_band, lower_band
 
 
+# 평균 상승폭과 평균 하락폭으로 RSI 계산, 가격 변화가 전혀 없으면 50을 반환함
+def rsi_from_averages(average_up: float, average_down: float) -> float:
+    total = average_up + average_down
+    if total == 0:
+        return 50.0
+    return average_up / total * 100
+
+
 # RSI 계산
 def rsi(closing_price_list: List[float], length: int):
     ups = [max(closing_price_list[i] - closing_price_list[i - 1], 0) for i in range(1, len(closing_price_list))]
@@ -78,6 +78,4 @@ def rsi(closing_price_list: List[float], length: int):
     average_up = rma(ups, length)
     average_down = rma(downs, length)
 
-    _rsi = average_up / (average_up + average_down) * 100
-
-    return _rsi
+    return rsi_from_averages(average_up, average_down)
@@ -0,0 +1,192 @@
+from collections import deque
+from math import fsum, inf, nextafter, sqrt
+from typing import Deque, List, Optional, Tuple
+
+from watcher import functions
+
+
+# 캔들이 마감될 때마다 한 번씩 갱신되는 와일더 RSI 상태
+# 마감된 캔들까지의 평균 상승폭/하락폭을 저장해 두고, 진행 중인 캔들의 RSI를 현재 가격으로 O(1)에 계산함
+class RsiState:
+    __slots__ = ('length', 'average_up', 'average_down', 'last_close', 'count', 'version')
+
+    def __init__(self, length: int):
+        self.length: int = length
+        self.average_up: float = 0.0
+        self.average_down: float = 0.0
+        self.last_close: Optional[float] = None    # 마지막으로 마감된 캔들의 종가
+        self.count: int = 0     # 반영된 가격 변화의 개수
+        self.version: int = 0   # 상태가 갱신될 때마다 증가함
+
+    # 마감된 캔들들의 종가 리스트로 상태를 처음부터 다시 계산함
+    def seed(self, closes: List[float]):
+        self.average_up = 0.0
+        self.average_down = 0.0
+        self.last_close = None
+        self.count = 0
+        for close in closes:
+            self.update(close)
+        self.version += 1
+
+    # 가격 변화 하나를 평균 상승폭/하락폭에 반영한 값을 반환함
+    # 처음 length개의 변화량은 단순 평균으로, 그 이후는 와일더 이동평균으로 반영함
+    def step(self, close: float, count: int):
+        change = close - self.last_close
+        up = change if change > 0 else 0.0
+        down = -change if change < 0 else 0.0
+        if count <= self.length:
+            average_up = self.average_up + (up - self.average_up) / count
+            average_down = self.average_down + (down - self.average_down) / count
+        else:
+            average_up = (self.average_up * (self.length - 1) + up) / self.length
+            average_down = (self.average_down * (self.length - 1) + down) / self.length
+        return average_up, average_down
+
+    # 캔들이 마감될 때 마감된 캔들의 종가로 상태를 갱신함
+    def update(self, close: float):
+        if self.last_close is not None:
+            self.count += 1
+            self.average_up, self.average_down = self.step(close, self.count)
+        self.last_close = close
+        self.version += 1
+
+    # 진행 중인 캔들의 종가가 price일 때의 RSI를 반환함, 마감된 캔들이 없으면 None을 반환함
+    def value(self, price: float) -> Optional[float]:
+        if self.last_close is None:
+            return None
+        average_up, average_down = self.step(price, self.count + 1)
+        return functions.rsi_from_averages(average_up, average_down)
+
+    # 진행 중인 캔들의 RSI를 평균 상승폭/하락폭에 곱해지는 가중치를 통분한 (상승폭 합, 하락폭 합)으로 반환함
+    # 현재 가격이 마지막 종가보다 x만큼 높으면 RSI = (up + x) / (up + x + down) 이 됨
+    def weighted_sums(self) -> Tuple[float, float]:
+        count = self.count + 1
+        weight = count - 1 if count <= self.length else self.length - 1
+        return self.average_up * weight, self.average_down * weight
+
+    # RSI가 target이 되는 가격을 계산함, RSI는 가격에 대해 증가함수이므로 상승폭 합과 하락폭 합이 모두 0이 아닐 때 유일함
+    def solve_price(self, target: float) -> float:
+        up, down = self.weighted_sums()
+        ratio = target / 100
+        # 마지막 종가보다 높은 가격에서 RSI가 target이 되는 경우
+        rise = ratio * down / (1 - ratio) - up
+        if rise >= 0:
+            return self.last_close + rise
+        # 마지막 종가보다 낮은 가격에서 RSI가 target이 되는 경우
+        fall = up * (1 - ratio) / ratio - down
+        return self.last_close - fall
+
+    # RSI가 upper_bound 이상이 되는 최저 가격을 반환함, 마감된 캔들이 없으면 None을 반환함
+    def upper_price(self, upper_bound: float) -> Optional[float]:
+        if self.last_close is None:
+            return None
+        up, down = self.weighted_sums()
+        if upper_bound <= 0:
+            return -inf
+        if upper_bound >= 100:
+            # 하락폭이 없고 가격이 오르거나 유지될 때만 RSI가 100이 됨
+            if down > 0:
+                return inf
+            return self.last_close if up > 0 else nextafter(self.last_close, inf)
+        if up + down == 0:
+            # 가격 변화가 전혀 없었다면 오르면 100, 유지되면 50, 내리면 0
+            return self.last_close if upper_bound <= 50 else nextafter(self.last_close, inf)
+        return self.solve_price(upper_bound)
+
+    # RSI가 lower_bound 이하가 되는 최고 가격을 반환함, 마감된 캔들이 없으면 None을 반환함
+    def lower_price(self, lower_bound: float) -> Optional[float]:
+        if self.last_close is None:
+            return None
+        up, down = self.weighted_sums()
+        if lower_bound >= 100:
+            return inf
+        if lower_bound <= 0:
+            # 상승폭이 없고 가격이 내리거나 유지될 때만 RSI가 0이 됨
+            if up > 0 or lower_bound < 0:
+                return -inf
+            return self.last_close if down > 0 else nextafter(self.last_close, -inf)
+        if up + down == 0:
+            return self.last_close if lower_bound >= 50 else nextafter(self.last_close, -inf)
+        return self.solve_price(lower_bound)
+
+
+# 캔들이 마감될 때마다 한 번씩 갱신되는 볼린저 밴드 상태
+# 마감된 최근 length - 1개 캔들의 종가를 링 버퍼에 저장하고 평균과 편차 제곱합을 슬라이딩 웰포드 방식으로 갱신함
+# 진행 중인 캔들의 종가를 포함한 밴드를 현재 가격으로 O(1)에 계산함
+class BollingerBandState:
+    __slots__ = ('length', 'closes', 'mean', 'm2', 'updates', 'version')
+
+    def __init__(self, length: int):
+        self.length: int = length
+        # 마감된 캔들의 종가, 진행 중인 캔들 하나를 더하면 length개가 됨
+        self.closes: Deque[float] = deque(maxlen=max(length - 1, 0))
+        self.mean: float = 0.0  # 버퍼에 있는 종가의 평균
+        self.m2: float = 0.0    # 버퍼에 있는 종가의 편차 제곱합
+        self.updates: int = 0   # 마지막으로 평균과 편차 제곱합을 다시 계산한 뒤 갱신된 횟수
+        self.version: int = 0   # 상태가 갱신될 때마다 증가함
+
+    # 마감된 캔들들의 종가 리스트로 상태를 처음부터 다시 계산함
+    def seed(self, closes: List[float]):
+        self.closes.clear()
+        if self.closes.maxlen:
+            self.closes.extend(closes[-self.closes.maxlen:])
+        self.recompute()
+        self.version += 1
+
+    # 누적 오차를 없애기 위해 버퍼의 종가로 평균과 편차 제곱합을 다시 계산함
+    def recompute(self):
+        self.updates = 0
+        if not self.closes:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        self.mean = fsum(self.closes) / len(self.closes)
+        self.m2 = fsum((close - self.mean) ** 2 for close in self.closes)
+
+    # 캔들이 마감될 때 마감된 캔들의 종가로 상태를 갱신함
+    def update(self, close: float):
+        self.version += 1
+        if not self.closes.maxlen:
+            return
+        if len(self.closes) == self.closes.maxlen:
+            # 가장 오래된 종가를 새 종가로 교체함
+            oldest = self.closes[0]
+            self.closes.append(close)
+            delta = close - oldest
+            mean = self.mean + delta / len(self.closes)
+            self.m2 += delta * (close - mean + oldest - self.mean)
+            self.mean = mean
+        else:
+            self.closes.append(close)
+            delta = close - self.mean
+            self.mean += delta / len(self.closes)
+            self.m2 += delta * (close - self.mean)
+        if self.m2 < 0:
+            self.m2 = 0.0
+        # 버퍼 길이만큼 갱신될 때마다 다시 계산하므로 계산 비용은 갱신당 O(1)로 유지됨
+        self.updates += 1
+        if self.updates >= self.closes.maxlen:
+            self.recompute()
+
+    # 진행 중인 캔들의 종가가 price일 때의 (중심선, 상단선, 하단선)을 반환함
+    def band(self, price: float, k: float) -> Tuple[float, float, float]:
+        count = len(self.closes) + 1
+        delta = price - self.mean
+        basis_band = self.mean + delta / count
+        variance = (self.m2 + delta * delta * (count - 1) / count) / count
+        stdev_value = sqrt(variance) if variance > 0 else 0.0
+        return basis_band, basis_band + stdev_value * k, basis_band - stdev_value * k
+
+    # 진행 중인 캔들의 종가가 상단선 이상이 되는 최저 가격과 하단선 이하가 되는 최고 가격을 반환함
+    # 가격 p와 마감된 종가 평균의 차이를 d라고 하면 p >= 상단선 은 d >= 0 이고 d^2 (n-1)(n-1-k^2) >= k^2 n m2 인 것과 같음
+    # k < 0 이거나 k^2 >= n-1 이면 돌파하는 가격 구간을 가격 하나로 나타낼 수 없으므로 None을 반환함
+    def band_prices(self, k: float) -> Optional[Tuple[float, float]]:
+        count = len(self.closes) + 1
+        # 진행 중인 캔들뿐이면 밴드의 폭이 0이므로 항상 돌파함
+        if count == 1:
+            return -inf, inf
+        margin = (count - 1) - k * k
+        if margin <= 0 or k < 0:
+            return None
+        offset = k * sqrt(count * self.m2 / ((count - 1) * margin))
+        return self.mean + offset, self.mean - offset
@@ -0,0 +1,234 @@
+# 지연 시간과 처리량 측정
+import asyncio
+from bisect import bisect_left
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from watcher.watcher import Watcher
+
+# 히스토그램 버킷의 상한(밀리초), 0.1ms부터 60초까지 1-2-5 간격
+LATENCY_BUCKETS: List[float] = [scale * base for scale in (0.1, 1, 10, 100, 1000, 10000) for base in (1, 2, 5)] \
+                               + [60000.0]
+
+# 측정 구간
+EXCHANGE_TO_RECEIVE = 'exchange_to_receive'     # 거래 체결 시각부터 웹소켓으로 받기까지
+RECEIVE_TO_EVALUATE = 'receive_to_evaluate'     # 거래를 받은 시각부터 조건 검사를 시작하기까지
+EVALUATE_TO_SEND = 'evaluate_to_send'           # 조건 검사를 시작한 시각부터 알림을 전송 대기열에 넣기까지
+ENQUEUE_TO_SEND = 'enqueue_to_send'             # 알림을 전송 대기열에 넣은 시각부터 전송에 성공한 요청을 보내기까지
+SEND_ROUND_TRIP = 'send_round_trip'             # 텔레그램 알림 전송 요청부터 응답까지
+STAGES = (EXCHANGE_TO_RECEIVE, RECEIVE_TO_EVALUATE, EVALUATE_TO_SEND, ENQUEUE_TO_SEND, SEND_ROUND_TRIP)
+
+
+# 고정된 버킷에 측정값의 개수만 세는 히스토그램, 측정값을 저장하지 않으므로 기록할 때 메모리를 새로 쓰지 않음
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        # 마지막 버킷은 가장 큰 상한을 넘는 측정값의 개수
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.maximum: float = 0.0
+
+    def record(self, milliseconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.maximum:
+            self.maximum = milliseconds
+
+    # ratio(0~1) 백분위수가 속한 버킷의 상한을 반환함, 상한이 최댓값보다 크거나 마지막 버킷이면 최댓값을 반환함
+    def percentile(self, ratio: float) -> float:
+        if self.count == 0:
+            return 0.0
+        target = ratio * self.count
+        cumulative_count = 0
+        for index, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count >= target and count > 0:
+                return min(LATENCY_BUCKETS[index], self.maximum) if index < len(LATENCY_BUCKETS) else self.maximum
+        return self.maximum
+
+    def reset(self):
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+
+# 종목 하나의 구간별 지연 시간 히스토그램
+class MarketLatency:
+    __slots__ = STAGES
+
+    def __init__(self):
+        for stage in STAGES:
+            setattr(self, stage, LatencyHistogram())
+
+
+class LatencyMetrics:
+    """
+    (거래소, 종목)별로 구간별 지연 시간 히스토그램을 모으고, 일정 시간마다 백분위수 요약을 출력함
+    """
+    def __init__(self, report_period: float = 60.0):
+        self.report_period = report_period
+        self.markets: Dict[Tuple[int, str], MarketLatency] = {}
+
+    # 종목의 히스토그램을 반환함, 요약을 출력한 뒤에도 같은 객체를 계속 사용하므로 태스크에서 한 번만 불러와도 됨
+    def get_market(self, exchange_id: int, symbol: str) -> MarketLatency:
+        market_latency = self.markets.get((exchange_id, symbol))
+        if market_latency is None:
+            market_latency = MarketLatency()
+            self.markets[(exchange_id, symbol)] = market_latency
+        return market_latency
+
+    def summary(self) -> List[str]:
+        lines = []
+        for (exchange_id, symbol), market_latency in self.markets.items():
+            for stage in STAGES:
+                histogram: LatencyHistogram = getattr(market_latency, stage)
+                if histogram.count == 0:
+                    continue
+                lines.append(f"[{exchange_id}] {symbol} {stage}: {histogram.count}건, "
+                             f"p50 {histogram.percentile(0.5):g}ms, p90 {histogram.percentile(0.9):g}ms, "
+                             f"p99 {histogram.percentile(0.99):g}ms, 최대 {histogram.maximum:.1f}ms")
+        return lines
+
+    def reset(self):
+        for market_latency in self.markets.values():
+            for stage in STAGES:
+                getattr(market_latency, stage).reset()
+
+    # 일정 시간마다 지난 구간의 지연 시간 요약을 출력하고 히스토그램을 비우는 태스크
+    async def report_task(self):
+        while True:
+            await asyncio.sleep(self.report_period)
+            lines = self.summary()
+            if lines:
+                print("======== 지연 시간 ========")
+                print('\n'.join(lines))
+            self.reset()
+
+
+# 종목 하나의 누적 처리량
+class MarketCounters:
+    __slots__ = ('trades', 'order_book_updates', 'alarms_evaluated', 'alarms_fired')
+
+    def __init__(self):
+        self.trades: int = 0
+        self.order_book_updates: int = 0
+        self.alarms_evaluated: int = 0
+        self.alarms_fired: int = 0
+
+
+class ThroughputCounters:
+    """
+    (거래소, 종목)별 누적 처리량, 초당 처리량은 수집하는 쪽에서 누적 값의 증가율로 계산함
+    """
+    def __init__(self):
+        self.markets: Dict[Tuple[int, str], MarketCounters] = {}
+
+    def get_market(self, exchange_id: int, symbol: str) -> MarketCounters:
+        market_counters = self.markets.get((exchange_id, symbol))
+        if market_counters is None:
+            market_counters = MarketCounters()
+            self.markets[(exchange_id, symbol)] = market_counters
+        return market_counters
+
+
+class MetricsServer:
+    """
+    Watcher의 상태를 Prometheus 텍스트 형식으로 내보내는 HTTP 서버
+    Watcher와 같은 이벤트 루프에서 asyncio 서버로 동작하며, 요청마다 현재 값을 읽어 응답하므로 루프를 막지 않음
+    """
+    def __init__(self, watcher: 'Watcher', host: str = '127.0.0.1', port: int = 9100, lag_period: float = 0.5):
+        self.watcher = watcher
+        self.host = host
+        self.port = port
+        self.lag_period = lag_period
+        self.loop_lag: float = 0.0          # 마지막으로 측정한 이벤트 루프 지연(초)
+        self.max_loop_lag: float = 0.0      # 마지막 수집 이후 가장 컸던 이벤트 루프 지연(초)
+
+    async def serve(self):
+        asyncio.ensure_future(self.loop_lag_task())
+        server = await asyncio.start_server(self.handle_request, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    # 정해진 시간만큼 잠든 뒤 실제로 깨어난 시각과의 차이로 이벤트 루프 지연을 측정하는 태스크
+    async def loop_lag_task(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(self.lag_period)
+            self.loop_lag = max(loop.time() - started_at - self.lag_period, 0.0)
+            if self.loop_lag > self.max_loop_lag:
+                self.max_loop_lag = self.loop_lag
+
+    async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # 요청 헤더는 사용하지 않으므로 빈 줄까지 읽고 버림
+            while (await reader.readline()).strip():
+                pass
+            path = request_line.split()[1] if len(request_line.split()) > 1 else b'/'
+            if path.split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b''
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # 현재 값을 Prometheus 텍스트 형식으로 만듦
+    def render(self) -> str:
+        watcher = self.watcher
+        cache = watcher.cache
+        lines: List[str] = []
+
+        def add_metric(name: str, metric_type: str, description: str, samples: List[Tuple[str, float]]):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        def market_labels(exchange_id: int, symbol: str) -> str:
+            return f'{{exchange="{exchange_id}",symbol="{symbol}"}}'
+
+        markets = list(watcher.throughput.markets.items())
+        add_metric('watcher_trades_total', 'counter', 'Trades received',
+                   [(market_labels(*market), counters.trades) for market, counters in markets])
+        add_metric('watcher_order_book_updates_total', 'counter', 'Order book updates received',
+                   [(market_labels(*market), counters.order_book_updates) for market, counters in markets])
+        add_metric('watcher_alarms_evaluated_total', 'counter', 'Alarm condition checks',
+                   [(market_labels(*market), counters.alarms_evaluated) for market, counters in markets])
+        add_metric('watcher_alarms_fired_total', 'counter', 'Alarm checks that met every condition',
+                   [(market_labels(*market), counters.alarms_fired) for market, counters in markets])
+        add_metric('watcher_registered_alarms', 'gauge', 'Registered alarms',
+                   [('', len(watcher.registered_alarms))])
+        add_metric('watcher_notifications_pending', 'gauge', 'Notifications waiting in the send queue',
+                   [('', watcher.notifier.pending)])
+        add_metric('watcher_notifications_sent_total', 'counter', 'Notifications delivered to Telegram',
+                   [('', watcher.notifier.sent_count)])
+        add_metric('watcher_notifications_overflowed_total', 'counter',
+                   'Notifications that found their chat queue full',
+                   [('', watcher.notifier.overflow_count)])
+        add_metric('watcher_notifications_dropped_total', 'counter', 'Notifications dropped after a failed send',
+                   [('', watcher.notifier.dropped_count)])
+        add_metric('watcher_candle_series', 'gauge', 'Cached candle series', [('', cache.candle_series_count())])
+        add_metric('watcher_cache_memory_bytes', 'gauge', 'Estimated memory used by cached candles and order books',
+                   [('', cache.estimate_memory())])
+        add_metric('watcher_reconnects_total', 'counter', 'Exchange websocket reconnects',
+                   [(f'{{exchange="{exchange_id}"}}', connection.reconnect_count)
+                    for exchange_id, connection in watcher.connections.items()])
+        add_metric('watcher_clock_offset_seconds', 'gauge', 'Local clock minus exchange clock',
+                   [(f'{{exchange="{exchange_id}"}}', cache.get_clock_offset(exchange_id))
+                    for exchange_id in cache.clock_offsets])
+        add_metric('watcher_event_loop_lag_seconds', 'gauge', 'Last measured event loop lag',
+                   [('', self.loop_lag)])
+        add_metric('watcher_event_loop_lag_max_seconds', 'gauge', 'Largest event loop lag since the last scrape',
+                   [('', self.max_loop_lag)])
+        self.max_loop_lag = self.loop_lag
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,288 @@
+# 텔레그램 알림 전송 대기열
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+
+from watcher.metrics import MarketLatency
+from watcher.outbox import Outbox, OutboxEntry
+
+# 텔레그램 메시지 하나의 최대 길이
+MESSAGE_LIMIT = 4096
+# 한 메시지로 합친 알림 사이의 구분선
+ALERT_SEPARATOR = '\n\n'
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    limit자보다 긴 알림 메시지를 limit자를 넘지 않는 조각들로 나눔
+    :param text: str, 나눌 알림 메시지
+    :param limit: int, 조각 하나의 최대 길이
+    :return: List[str], 줄 단위로 나눈 조각 리스트, 한 줄이 limit자보다 길면 limit자씩 나눔
+    """
+    if len(text) <= limit:
+        return [text]
+    pieces: List[str] = []
+    piece = ''
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if piece:
+                pieces.append(piece)
+                piece = ''
+            pieces.append(line[:limit])
+            line = line[limit:]
+        if len(piece) + len(line) > limit:
+            pieces.append(piece)
+            piece = ''
+        piece += line
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def merge_texts(texts: List[str], limit: int = MESSAGE_LIMIT) -> List[Tuple[str, List[int]]]:
+    """
+    알림 메시지들을 순서대로 이어 붙여 limit자를 넘지 않는 메시지들로 합침
+    :param texts: List[str], 합칠 알림 메시지 리스트
+    :param limit: int, 메시지 하나의 최대 길이
+    :return: List[Tuple[str, List[int]]], (합친 메시지, 메시지에 내용이 들어간 알림의 texts 인덱스) 리스트,
+             limit자보다 긴 알림은 split_text로 나눠 여러 메시지에 걸쳐 들어감
+    """
+    messages: List[Tuple[str, List[int]]] = []
+    message = ''
+    indices: List[int] = []
+    for index, text in enumerate(texts):
+        for piece in split_text(text, limit):
+            if indices and len(message) + len(ALERT_SEPARATOR) + len(piece) <= limit:
+                message += ALERT_SEPARATOR + piece
+            else:
+                if indices:
+                    messages.append((message, indices))
+                message = piece
+                indices = []
+            if not indices or indices[-1] != index:
+                indices.append(index)
+    if indices:
+        messages.append((message, indices))
+    return messages
+
+
+class TokenBucket:
+    """
+    초당 rate개씩 토큰이 채워지고 최대 capacity개까지 쌓이는 토큰 버킷
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens: float = capacity
+        self.updated_at: float = time.monotonic()
+
+    # 토큰을 하나 꺼냄, 토큰이 없으면 꺼내지 않고 토큰이 채워질 때까지 기다려야 하는 시간(초)을 반환함
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.take()
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
+
+
+class Notification:
+    __slots__ = ('chat_id', 'text', 'latencies', 'outbox_entries', 'attempts')
+
+    def __init__(self, chat_id: int, text: str, latencies: List[Tuple[MarketLatency, float]],
+                 outbox_entries: List[OutboxEntry]):
+        self.chat_id = chat_id
+        self.text = text
+        # 지연 시간을 기록할 (종목의 지연 시간 히스토그램, 대기열에 넣은 시각), 여러 알림을 합친 메시지면 각 알림의 값
+        self.latencies = latencies
+        # 전송 결과를 표시할 outbox 기록
+        self.outbox_entries = outbox_entries
+        self.attempts: int = 0
+
+
+class Notifier:
+    """
+    알림을 대기열에 넣고 백그라운드에서 전송함, 알림을 넣는 쪽은 전송을 기다리지 않음
+    채팅방마다 대기열과 전송 태스크를 두어 한 채팅방의 전송 제한이 다른 채팅방의 알림을 막지 않게 하고, 같은 채팅방의 알림 순서를 유지함
+    텔레그램 제한에 맞춰 전체 초당 global_rate개, 채팅방마다 초당 chat_rate개까지 전송하며,
+    429 응답을 받으면 retry_after초 동안 모든 전송을 멈춘 뒤 다시 보냄
+    채팅방에 알림이 들어오면 coalesce_window초 동안 더 기다린 뒤, 그동안 쌓인 알림을 최대 길이 안에서 한 메시지로 합쳐 보냄
+    outbox가 주어지면 대기열에 넣은 알림을 기록하고 전송 결과를 표시해, 버린 알림을 나중에 다시 보낼 수 있게 함
+    """
+    # 채팅방마다 대기열이 가득 찼다는 로그를 남기는 최소 간격(초)
+    overflow_log_period = 60.0
+
+    def __init__(self, bot: AsyncTeleBot, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 queue_size: int = 1000, max_attempts: int = 5, coalesce_window: float = 1.0,
+                 outbox: Optional[Outbox] = None):
+        self.bot = bot
+        self.outbox = outbox
+        self.coalesce_window = coalesce_window
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        # 채팅방별 토큰 버킷과 대기열
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.chat_queues: Dict[int, asyncio.Queue] = {}
+        # 429 응답을 받은 뒤 전송을 다시 시작할 시각(time.monotonic 기준)
+        self.resume_at: float = 0.0
+        self.sent_count: int = 0
+        self.dropped_count: int = 0
+        # 대기열이 가득 차 대기열에 넣지 못한 알림 수, outbox에 기록되어 나중에 다시 보내는 알림도 포함함
+        self.overflow_count: int = 0
+        # 채팅방별 대기열이 가득 찼다는 로그를 마지막으로 남긴 시각(time.monotonic 기준)과 그 이후 넣지 못한 알림 수
+        self.overflow_logged_at: Dict[int, float] = {}
+        self.overflow_counts: Dict[int, int] = {}
+
+    # 아직 전송하지 않은 알림 수
+    @property
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self.chat_queues.values())
+
+    def enqueue(self, chat_id: int, text: str, market_latency: Optional[MarketLatency] = None,
+                outbox_entry: Optional[OutboxEntry] = None) -> bool:
+        """
+        알림을 대기열에 넣음
+        :param chat_id: int, 알림을 받을 채팅방 ID
+        :param text: str, 알림 메시지
+        :param market_latency: MarketLatency, 대기열에서 기다린 시간과 전송 요청부터 응답까지의 시간을 기록할 종목의 히스토그램
+        :param outbox_entry: OutboxEntry, 다시 보내는 알림의 outbox 기록, 주어지지 않으면 새로 기록함
+        :return: bool, 알림을 대기열이나 outbox에 넣었으면 True, 대기열이 가득 차 알림을 버렸으면 False
+        """
+        queue = self.chat_queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self.chat_queues[chat_id] = queue
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            asyncio.ensure_future(self.chat_sending_task(chat_id))
+        # 새 알림은 대기열에 넣기 전에 기록해, 대기열이 가득 차도 outbox에서 나중에 다시 보낼 수 있게 함
+        is_new_entry = outbox_entry is None and self.outbox is not None
+        if is_new_entry:
+            outbox_entry = self.outbox.add(chat_id, text)
+        if queue.full():
+            self.log_overflow(chat_id)
+            if is_new_entry:
+                self.outbox.mark_failed(outbox_entry)
+                return True
+            self.dropped_count += 1
+            return False
+        latencies = [(market_latency, time.time())] if market_latency is not None else []
+        queue.put_nowait(Notification(chat_id, text, latencies, [outbox_entry] if outbox_entry is not None else []))
+        return True
+
+    # 대기열에 넣지 못한 알림을 세고, 채팅방마다 overflow_log_period초에 한 번만 로그를 남김
+    def log_overflow(self, chat_id: int):
+        self.overflow_count += 1
+        self.overflow_counts[chat_id] = self.overflow_counts.get(chat_id, 0) + 1
+        now = time.monotonic()
+        if now - self.overflow_logged_at.get(chat_id, -self.overflow_log_period) < self.overflow_log_period:
+            return
+        print(f"[{chat_id}] 알림 대기열이 가득 참, 지난 로그 이후 대기열에 넣지 못한 알림 {self.overflow_counts[chat_id]}개")
+        self.overflow_logged_at[chat_id] = now
+        self.overflow_counts[chat_id] = 0
+
+    # 채팅방의 대기열에서 알림을 꺼내 합친 뒤 전송 제한에 맞춰 전송하는 태스크
+    async def chat_sending_task(self, chat_id: int):
+        queue = self.chat_queues[chat_id]
+        chat_bucket = self.chat_buckets[chat_id]
+        while True:
+            notifications: List[Notification] = [await queue.get()]
+            if self.coalesce_window > 0:
+                await asyncio.sleep(self.coalesce_window)
+            while not queue.empty():
+                notifications.append(queue.get_nowait())
+            for notification in self.coalesce(chat_id, notifications):
+                await chat_bucket.acquire()
+                while not await self.send(notification):
+                    pass
+
+    # 같은 채팅방의 알림들을 최대 길이를 넘지 않는 메시지들로 합침
+    @staticmethod
+    def coalesce(chat_id: int, notifications: List[Notification]) -> List[Notification]:
+        if len(notifications) == 1 and len(notifications[0].text) <= MESSAGE_LIMIT:
+            return notifications
+        coalesced_notifications = []
+        first_messages: Dict[int, Notification] = {}
+        last_messages: Dict[int, Notification] = {}
+        for text, indices in merge_texts([notification.text for notification in notifications]):
+            coalesced_notification = Notification(chat_id, text, [], [])
+            coalesced_notifications.append(coalesced_notification)
+            for index in indices:
+                first_messages.setdefault(index, coalesced_notification)
+                last_messages[index] = coalesced_notification
+        # 알림이 여러 메시지로 나뉘면 지연 시간은 첫 메시지를 보낼 때 기록하고,
+        # 마지막 메시지까지 전송되어야 전송 완료로 표시함
+        for index, notification in enumerate(notifications):
+            first_messages[index].latencies += notification.latencies
+            last_messages[index].outbox_entries += notification.outbox_entries
+        return coalesced_notifications
+
+    # 알림을 한 번 전송함, 다시 보내야 하면 False를 반환함
+    async def send(self, notification: Notification) -> bool:
+        wait = self.resume_at - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self.global_bucket.acquire()
+        notification.attempts += 1
+        sent_at = time.time()
+        try:
+            await self.bot.send_message(notification.chat_id, notification.text)
+        except ApiTelegramException as e:
+            if e.error_code == 429 and notification.attempts < self.max_attempts:
+                retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+                print(f"[{notification.chat_id}] 텔레그램 전송 제한, {retry_after}초 뒤 다시 전송")
+                return False
+            # 채널에서 봇이 제거된 경우처럼 다시 보내도 실패하는 알림은 버림
+            self.drop(notification)
+            print(f"[{notification.chat_id}] 알림 전송 실패: {e.description}")
+            return True
+        except Exception as e:
+            # 네트워크 오류는 점점 길게 기다린 뒤 다시 보냄
+            if notification.attempts < self.max_attempts:
+                await asyncio.sleep(2 ** notification.attempts)
+                return False
+            self.drop(notification)
+            print(f"[{notification.chat_id}] 알림 전송 실패: {e!r}")
+            return True
+        self.record_latencies(notification, sent_at)
+        self.sent_count += 1
+        if self.outbox is not None:
+            for entry in notification.outbox_entries:
+                self.outbox.mark_delivered(entry)
+        return True
+
+    # 전송에 성공한 알림이 대기열에서 기다린 시간과 전송 요청부터 응답까지의 시간을 기록함
+    # 재전송한 알림은 대기열에 넣은 시각부터 전송에 성공한 요청을 보내기까지 429 대기와 재시도 시간을 모두 포함함
+    @staticmethod
+    def record_latencies(notification: Notification, sent_at: float):
+        round_trip = (time.time() - sent_at) * 1000
+        recorded_markets = set()
+        for market_latency, enqueued_at in notification.latencies:
+            market_latency.enqueue_to_send.record((sent_at - enqueued_at) * 1000)
+            # 같은 종목의 알림을 여러 개 합친 메시지는 전송 시간을 한 번만 기록함
+            if id(market_latency) not in recorded_markets:
+                recorded_markets.add(id(market_latency))
+                market_latency.send_round_trip.record(round_trip)
+
+    # 전송을 포기한 알림을 outbox의 재전송 대상으로 돌려놓음
+    def drop(self, notification: Notification):
+        self.dropped_count += 1
+        if self.outbox is not None:
+            for entry in notification.outbox_entries:
+                self.outbox.mark_failed(entry)
@@ -0,0 +1,133 @@
+# 알림 전송 기록
+import asyncio
+from typing import List, Optional, Set, TYPE_CHECKING
+
+from database.database import Database
+
+if TYPE_CHECKING:
+    from watcher.notifier import Notifier
+
+
+class OutboxEntry:
+    __slots__ = ('chat_id', 'text', 'outbox_id', 'delivered', 'failed')
+
+    def __init__(self, chat_id: int, text: str, outbox_id: Optional[int] = None):
+        self.chat_id = chat_id
+        self.text = text
+        # outbox 테이블에 입력되기 전이면 None
+        self.outbox_id = outbox_id
+        self.delivered = False
+        self.failed = False
+
+
+class Outbox:
+    """
+    대기열에 넣은 알림을 outbox 테이블에 기록하고, 전송에 실패했거나 프로세스가 재시작되어 전송되지 못한 알림을 다시 보냄
+    알림을 넣을 때는 메모리에만 쌓고 flush_period초마다 모아서 한 번에 입력하며, 데이터베이스 호출은 모두 스레드 풀에서 실행해
+    이벤트 루프를 막지 않음
+    한 알림이 여러 메시지로 나뉘면 마지막 메시지가 전송되어야 전송 완료로 표시하므로, 재전송하면 앞 메시지가 두 번 갈 수 있음
+    """
+    def __init__(self, database: Database, flush_period: float = 1.0, retry_period: float = 30.0,
+                 retry_delay: float = 10.0, max_attempts: int = 8, retry_batch_size: int = 100):
+        self.database = database
+        self.flush_period = flush_period
+        self.retry_period = retry_period
+        # 첫 재전송까지 기다리는 시간, 재전송할 때마다 두 배로 늘어남
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.retry_batch_size = retry_batch_size
+        # 아직 테이블에 입력하지 않은 알림
+        self.pending_entries: List[OutboxEntry] = []
+        # 전송했지만 아직 테이블에 전송 완료로 표시하지 않은 알림 ID
+        self.delivered_ids: List[int] = []
+        # 이 프로세스의 전송 대기열에 들어 있는 알림 ID, 재전송 대상에서 제외함
+        self.in_flight_ids: Set[int] = set()
+
+    def create_table(self):
+        self.database.create_outbox_table()
+
+    # 새 알림을 기록함, 테이블에는 다음 flush 때 입력됨
+    def add(self, chat_id: int, text: str) -> OutboxEntry:
+        entry = OutboxEntry(chat_id, text)
+        self.pending_entries.append(entry)
+        return entry
+
+    def mark_delivered(self, entry: OutboxEntry):
+        entry.delivered = True
+        # 테이블에 입력되기 전이면 입력한 뒤에 전송 완료로 표시함
+        if entry.outbox_id is not None:
+            self.in_flight_ids.discard(entry.outbox_id)
+            self.delivered_ids.append(entry.outbox_id)
+
+    # 전송에 실패한 알림을 재전송 대상으로 돌려놓음
+    def mark_failed(self, entry: OutboxEntry):
+        entry.failed = True
+        if entry.outbox_id is not None:
+            self.in_flight_ids.discard(entry.outbox_id)
+
+    # 쌓인 알림을 테이블에 입력하고 전송된 알림을 전송 완료로 표시함
+    async def flush(self):
+        loop = asyncio.get_event_loop()
+        entries, self.pending_entries = self.pending_entries, []
+        if entries:
+            try:
+                outbox_ids = await loop.run_in_executor(
+                    None, self.database.insert_outbox, [(entry.chat_id, entry.text) for entry in entries])
+            except Exception as e:
+                # 데이터베이스에 연결할 수 없으면 다음 flush 때 다시 입력함
+                self.pending_entries = entries + self.pending_entries
+                print(f"outbox 입력 실패: {e!r}")
+                return
+            for entry, outbox_id in zip(entries, outbox_ids):
+                entry.outbox_id = outbox_id
+                if entry.delivered:
+                    self.delivered_ids.append(outbox_id)
+                elif not entry.failed:
+                    self.in_flight_ids.add(outbox_id)
+        delivered_ids, self.delivered_ids = self.delivered_ids, []
+        if delivered_ids:
+            try:
+                await loop.run_in_executor(None, self.database.mark_outbox_delivered, delivered_ids)
+            except Exception as e:
+                self.delivered_ids = delivered_ids + self.delivered_ids
+                print(f"outbox 전송 완료 표시 실패: {e!r}")
+
+    # 종료할 때 남은 기록을 이벤트 루프 없이 테이블에 반영함
+    def close(self):
+        entries, self.pending_entries = self.pending_entries, []
+        try:
+            outbox_ids = self.database.insert_outbox([(entry.chat_id, entry.text) for entry in entries])
+            self.delivered_ids += [outbox_id for entry, outbox_id in zip(entries, outbox_ids) if entry.delivered]
+            self.database.mark_outbox_delivered(self.delivered_ids)
+            self.delivered_ids = []
+        except Exception as e:
+            print(f"outbox 저장 실패: {e!r}")
+
+    async def flush_task(self):
+        while True:
+            await asyncio.sleep(self.flush_period)
+            await self.flush()
+
+    # 전송되지 않은 알림을 테이블에서 불러와 다시 전송 대기열에 넣음
+    async def retry(self, notifier: 'Notifier'):
+        loop = asyncio.get_event_loop()
+        result_set = await loop.run_in_executor(
+            None, self.database.select_undelivered_outbox, self.max_attempts, self.retry_batch_size)
+        rows = [row for row in result_set.values() if row['outbox_id'] not in self.in_flight_ids]
+        if not rows:
+            return
+        await loop.run_in_executor(
+            None, self.database.reschedule_outbox, [row['outbox_id'] for row in rows], self.retry_delay)
+        for row in rows:
+            entry = OutboxEntry(row['chat_id'], row['text'], row['outbox_id'])
+            if notifier.enqueue(row['chat_id'], row['text'], outbox_entry=entry):
+                self.in_flight_ids.add(row['outbox_id'])
+        print(f"전송되지 않은 알림 {len(rows)}개 재전송")
+
+    async def retry_task(self, notifier: 'Notifier'):
+        while True:
+            try:
+                await self.retry(notifier)
+            except Exception as e:
+                print(f"outbox 재전송 실패: {e!r}")
+            await asyncio.sleep(self.retry_period)
@@ -0,0 +1,174 @@
+# 거래/호가 기록기
+import asyncio
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ccxt.base.types import Trade, OrderBook
+
+# 레코드 종류
+TRADE_BUY = 0
+TRADE_SELL = 1
+BOOK_BID = 2
+BOOK_ASK = 3
+# 호가 하나의 시작을 나타내는 레코드, 가격 자리에 매수 호가 수, 수량 자리에 매도 호가 수를 저장하고 이어서 호가 레코드가 옴
+BOOK_START = 4
+
+# 타임스탬프(밀리초), 가격, 수량, 종류, 거래소 ID, 종목 ID
+RECORD = struct.Struct('<qddBBI')
+SEGMENT_PREFIX = 'tape-'
+SEGMENT_SUFFIX = '.bin'
+SYMBOLS_FILE_NAME = 'symbols.tsv'
+
+
+# 종목 ID 파일을 읽어 {종목 ID: (거래소 ID, 종목)} 딕셔너리로 반환함
+def read_symbols(directory: str) -> Dict[int, Tuple[int, str]]:
+    symbols: Dict[int, Tuple[int, str]] = {}
+    path = os.path.join(directory, SYMBOLS_FILE_NAME)
+    if not os.path.exists(path):
+        return symbols
+    with open(path, 'r') as file:
+        for line in file:
+            symbol_id, exchange_id, symbol = line.rstrip('\n').split('\t')
+            symbols[int(symbol_id)] = (int(exchange_id), symbol)
+    return symbols
+
+
+# 디렉터리의 세그먼트 파일 경로를 순서대로 반환함
+def list_segments(directory: str) -> List[str]:
+    file_names = [file_name for file_name in os.listdir(directory)
+                  if file_name.startswith(SEGMENT_PREFIX) and file_name.endswith(SEGMENT_SUFFIX)]
+    return [os.path.join(directory, file_name) for file_name in sorted(file_names)]
+
+
+class TapeRecorder:
+    """
+    받은 거래와 호가를 고정 길이 레코드로 세그먼트 파일 끝에 덧붙여 기록함
+    레코드는 메모리에 모았다가 한 번에 쓰고, 세그먼트가 segment_size 바이트를 넘으면 새 세그먼트로 넘어감
+    """
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, buffer_size: int = 256 * 1024,
+                 flush_period: float = 1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.flush_period = flush_period
+        os.makedirs(directory, exist_ok=True)
+        # (거래소 ID, 종목)별 종목 ID
+        self.symbol_ids: Dict[Tuple[int, str], int] = {
+            market: symbol_id for symbol_id, market in read_symbols(directory).items()
+        }
+        self.buffer = bytearray()
+        # 이전 실행의 세그먼트에 이어 쓰지 않고 새 세그먼트부터 기록함
+        segments = list_segments(directory)
+        self.segment_index = int(os.path.basename(segments[-1])[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 \
+            if segments else 0
+        self.segment_file = None
+        self.open_segment()
+
+    def open_segment(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+        file_name = f'{SEGMENT_PREFIX}{self.segment_index:06d}{SEGMENT_SUFFIX}'
+        self.segment_file = open(os.path.join(self.directory, file_name), 'ab')
+        self.segment_index += 1
+
+    # 종목 ID를 반환함, 처음 보는 종목이면 새 ID를 발급해 종목 ID 파일에 추가함
+    def get_symbol_id(self, exchange_id: int, symbol: str) -> int:
+        symbol_id = self.symbol_ids.get((exchange_id, symbol))
+        if symbol_id is None:
+            symbol_id = len(self.symbol_ids)
+            self.symbol_ids[(exchange_id, symbol)] = symbol_id
+            with open(os.path.join(self.directory, SYMBOLS_FILE_NAME), 'a') as file:
+                file.write(f'{symbol_id}\t{exchange_id}\t{symbol}\n')
+        return symbol_id
+
+    def record_trades(self, exchange_id: int, trades: List[Trade]):
+        for trade in trades:
+            symbol_id = self.get_symbol_id(exchange_id, trade['symbol'].split(':')[0])
+            side = TRADE_SELL if trade['side'] == 'sell' else TRADE_BUY
+            timestamp = trade['timestamp'] or int(time.time() * 1000)
+            self.buffer += RECORD.pack(timestamp, trade['price'], trade['amount'], side, exchange_id, symbol_id)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def record_order_book(self, exchange_id: int, symbol: str, order_book: OrderBook):
+        symbol_id = self.get_symbol_id(exchange_id, symbol)
+        timestamp = order_book['timestamp'] or int(time.time() * 1000)
+        bids = order_book['bids']
+        asks = order_book['asks']
+        self.buffer += RECORD.pack(timestamp, len(bids), len(asks), BOOK_START, exchange_id, symbol_id)
+        for price, amount, *_ in bids:
+            self.buffer += RECORD.pack(timestamp, price, amount, BOOK_BID, exchange_id, symbol_id)
+        for price, amount, *_ in asks:
+            self.buffer += RECORD.pack(timestamp, price, amount, BOOK_ASK, exchange_id, symbol_id)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    # 모아둔 레코드를 세그먼트에 씀
+    def flush(self):
+        if not self.buffer:
+            return
+        self.segment_file.write(self.buffer)
+        self.segment_file.flush()
+        self.buffer.clear()
+        if self.segment_file.tell() >= self.segment_size:
+            self.open_segment()
+
+    # 거래가 적을 때도 기록이 늦어지지 않도록 일정 시간마다 모아둔 레코드를 쓰는 태스크
+    async def flush_task(self):
+        while True:
+            await asyncio.sleep(self.flush_period)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self.segment_file.close()
+
+
+class TapeReader:
+    """
+    기록된 세그먼트를 메모리 맵으로 열어 파일 전체를 읽어 들이지 않고 레코드를 순서대로 읽음
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.symbols: Dict[int, Tuple[int, str]] = read_symbols(directory)
+
+    @property
+    def segments(self) -> List[str]:
+        return list_segments(self.directory)
+
+    # 세그먼트 하나의 레코드를 (타임스탬프, 가격, 수량, 종류, 거래소 ID, 종목 ID) 튜플로 순서대로 반환함
+    @staticmethod
+    def read_segment(path: str) -> Iterator[Tuple[int, float, float, int, int, int]]:
+        size = os.path.getsize(path)
+        # 기록 중에 종료되어 잘린 마지막 레코드는 무시함
+        size -= size % RECORD.size
+        if size == 0:
+            return
+        with open(path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)[:size]
+                try:
+                    yield from RECORD.iter_unpack(view)
+                finally:
+                    view.release()
+
+    # 모든 세그먼트의 레코드를 기록된 순서대로 반환함
+    def records(self) -> Iterator[Tuple[int, float, float, int, int, int]]:
+        for path in self.segments:
+            yield from self.read_segment(path)
+
+    # 거래 레코드만 (타임스탬프, 거래소 ID, 종목, 가격, 수량, 매도 여부) 튜플로 반환함
+    def trades(self, exchange_id: Optional[int] = None,
+               symbol: Optional[str] = None) -> Iterator[Tuple[int, int, str, float, float, bool]]:
+        for timestamp, price, amount, kind, record_exchange_id, symbol_id in self.records():
+            if kind > TRADE_SELL:
+                continue
+            if exchange_id is not None and record_exchange_id != exchange_id:
+                continue
+            record_symbol = self.symbols[symbol_id][1]
+            if symbol is not None and record_symbol != symbol:
+                continue
+            yield timestamp, record_exchange_id, record_symbol, price, amount, kind == TRADE_SELL
@@ -0,0 +1,119 @@
+# 기록된 거래/호가 재생기
+import json
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from ccxt.base.types import Trade, OrderBook
+
+from watcher.cache import Cache
+from watcher.recorder import TapeReader, TRADE_SELL, BOOK_START, BOOK_BID
+from watcher.watcher import Alarm, Watcher
+
+
+# 알람 JSON 파일을 읽어 알람 리스트로 반환함, 파일은 {"alarm": AlarmDict, "condition": Condition}의 리스트
+def load_alarms(path: str) -> List[Alarm]:
+    with open(path, 'r') as file:
+        entries = json.load(file)
+    return [Alarm(alarm=entry['alarm'], condition=entry['condition']) for entry in entries]
+
+
+class Replay:
+    """
+    기록된 거래와 호가를 웹소켓과 텔레그램 없이 Cache와 Watcher.check_alarm에 그대로 흘려보내고,
+    전송되었을 알림을 모아 알람별 알림 수와 초당 처리한 거래 수를 보고함
+    기록된 타임스탬프를 가상 시계로 사용하므로 기다리지 않고 최대한 빠르게 재생함
+    """
+    def __init__(self, tape_directory: str, alarms: List[Alarm], candle_depth: int = 100):
+        self.reader = TapeReader(tape_directory)
+        # 마지막으로 재생한 레코드의 타임스탬프(초)
+        self.current_timestamp: float = 0.0
+        self.watcher = Watcher(_database=None, bot=None)
+        self.watcher.cache = Cache(candle_depth=candle_depth, clock=self.clock)
+        for alarm in alarms:
+            self.watcher.registered_alarms[alarm.id] = alarm
+            self.watcher.index_alarm(alarm)
+        # 캔들 저장소를 만든 (거래소, 종목)
+        self.started_markets: Set[Tuple[int, str]] = set()
+        self.alerts: List[dict] = []
+        self.fire_counts: Dict[int, int] = {alarm.id: 0 for alarm in alarms}
+        self.trade_count = 0
+        self.order_book_count = 0
+
+    @property
+    def cache(self) -> Cache:
+        return self.watcher.cache
+
+    def clock(self) -> float:
+        return self.current_timestamp
+
+    # 알람이 있는 종목의 첫 레코드에서 캔들 저장소와 빈 호가를 만듦
+    def start_market(self, exchange_id: int, symbol: str):
+        self.started_markets.add((exchange_id, symbol))
+        for alarm in self.watcher.get_alarms(exchange_id, symbol):
+            self.watcher.create_alarm_storage(alarm)
+        self.cache.start_candle_series(exchange_id, symbol)
+        self.cache.cache_order_book({'symbol': symbol, 'bids': [], 'asks': []}, exchange_id, symbol)
+
+    def replay_trade(self, exchange_id: int, trade: Trade):
+        symbol = trade['symbol']
+        alarms = self.watcher.get_alarms(exchange_id, symbol)
+        if not alarms:
+            return
+        if (exchange_id, symbol) not in self.started_markets:
+            self.start_market(exchange_id, symbol)
+        self.trade_count += 1
+        # 거래가 없던 다른 종목의 캔들도 기록된 시각에 맞춰 마감함
+        self.cache.run_due_rollovers(exchange_id, self.current_timestamp)
+        self.cache.cache_trade(trade, exchange_id)
+        # Watcher.trade_watching_task와 같은 방법으로 조건을 검사함
+        for alarm, check_result in self.watcher.evaluate_alarms(alarms, trade):
+            self.fire_counts[alarm.id] += 1
+            whales = check_result['whales']
+            self.alerts.append({
+                'alarm_id': alarm.id,
+                'timestamp': trade['timestamp'],
+                'price': trade['price'],
+                'amount': trade['amount'],
+                'rsi': check_result['rsi'],
+                'crossed_band': check_result['crossed_band'],
+                'whales': None if whales is None else {'bids': len(whales['bids']), 'asks': len(whales['asks'])}
+            })
+
+    def replay_order_book(self, exchange_id: int, order_book: OrderBook):
+        symbol = order_book['symbol']
+        if not self.watcher.is_market_registered(exchange_id, symbol):
+            return
+        if (exchange_id, symbol) not in self.started_markets:
+            self.start_market(exchange_id, symbol)
+        self.order_book_count += 1
+        self.cache.cache_order_book(order_book, exchange_id, symbol)
+
+    def run(self) -> dict:
+        started_at = time.perf_counter()
+        # 조립 중인 호가와 남은 호가 레코드 수
+        order_book: Optional[OrderBook] = None
+        remaining_levels = 0
+        for timestamp, price, amount, kind, exchange_id, symbol_id in self.reader.records():
+            self.current_timestamp = timestamp / 1000
+            symbol = self.reader.symbols[symbol_id][1]
+            if kind <= TRADE_SELL:
+                trade = {'symbol': symbol, 'timestamp': timestamp, 'price': price, 'amount': amount,
+                         'side': 'sell' if kind == TRADE_SELL else 'buy'}
+                self.replay_trade(exchange_id, trade)
+                continue
+            if kind == BOOK_START:
+                order_book = {'symbol': symbol, 'timestamp': timestamp, 'bids': [], 'asks': []}
+                remaining_levels = int(price) + int(amount)
+            else:
+                order_book['bids' if kind == BOOK_BID else 'asks'].append([price, amount])
+                remaining_levels -= 1
+            if remaining_levels == 0:
+                self.replay_order_book(exchange_id, order_book)
+        elapsed = time.perf_counter() - started_at
+        return {
+            'trades': self.trade_count,
+            'order_books': self.order_book_count,
+            'elapsed_seconds': elapsed,
+            'trades_per_second': self.trade_count / elapsed if elapsed > 0 else 0.0,
+            'fire_counts': self.fire_counts
+        }
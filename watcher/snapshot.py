@@ -0,0 +1,105 @@
+# 캔들 캐시 스냅샷
+import os
+import struct
+import time
+from datetime import datetime
+from math import isnan, nan
+from typing import Iterator, List, Tuple
+
+from watcher.definition import Interval, Candle, CandleSeries
+from watcher.cache import Cache
+
+
+class CandleSnapshot:
+    """
+    캐시된 캔들을 파일에 저장하고, 다시 시작할 때 불러와 과거 데이터 요청을 빈 구간만으로 줄임
+    파일 구조: 헤더 | (시리즈 헤더 | 시리즈 이름 | 캔들 레코드 * 캔들 수) * 시리즈 수
+    """
+    magic = b'CNDL'
+    version = 1
+    # 매직 값, 버전, 저장한 시각, 시리즈 수
+    header = struct.Struct('<4sHdI')
+    # 거래소 ID, 종목 길이, 인터벌 길이, 캔들 수
+    series_header = struct.Struct('<BHBI')
+    # 시작 타임스탬프, 시가, 고가, 저가, 종가, 거래량, 거래 수, 값이 없는 가격은 NaN으로 저장함
+    record = struct.Struct('<qdddddI')
+
+    def __init__(self, path: str):
+        self.path = path
+
+    # 캐시의 모든 캔들 시리즈를 파일에 저장함, 저장 중에 종료되어도 이전 파일이 남도록 임시 파일에 쓴 뒤 교체함
+    def save(self, cache: Cache):
+        series_list = [(exchange_id, symbol, interval, candle_series)
+                       for exchange_id, symbol_cache in cache.candles.items()
+                       for symbol, interval_cache in symbol_cache.items()
+                       for interval, candle_series in interval_cache.items()
+                       if len(candle_series) > 0]
+        chunks: List[bytes] = [self.header.pack(self.magic, self.version, time.time(), len(series_list))]
+        for exchange_id, symbol, interval, candle_series in series_list:
+            symbol_bytes = symbol.encode()
+            interval_bytes = str(interval).encode()
+            chunks.append(self.series_header.pack(exchange_id, len(symbol_bytes), len(interval_bytes),
+                                                  len(candle_series)))
+            chunks.append(symbol_bytes + interval_bytes)
+            for candle in candle_series:
+                chunks.append(self.pack_candle(candle))
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(b''.join(chunks))
+        os.replace(temporary_path, self.path)
+
+    def pack_candle(self, candle: Candle) -> bytes:
+        prices = [nan if price is None else price for price in (candle.open, candle.high, candle.low, candle.close)]
+        return self.record.pack(candle.timestamp, *prices, candle.volume, candle.trade_count)
+
+    # 파일에서 (거래소, 종목, 인터벌)별 캔들 리스트를 읽음
+    def read(self) -> Iterator[Tuple[int, str, Interval, List[Candle]]]:
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        magic, version, _, series_count = self.header.unpack_from(data, 0)
+        if magic != self.magic or version != self.version:
+            return
+        offset = self.header.size
+        for _ in range(series_count):
+            exchange_id, symbol_length, interval_length, candle_count = self.series_header.unpack_from(data, offset)
+            offset += self.series_header.size
+            symbol = data[offset:offset + symbol_length].decode()
+            offset += symbol_length
+            interval = Interval(string=data[offset:offset + interval_length].decode())
+            offset += interval_length
+            candles: List[Candle] = []
+            records_end = offset + self.record.size * candle_count
+            for timestamp, *prices, volume, trade_count in self.record.iter_unpack(data[offset:records_end]):
+                candle = Candle(exchange_id, symbol, datetime.fromtimestamp(timestamp), interval)
+                candle.open, candle.high, candle.low, candle.close = [None if isnan(price) else price
+                                                                      for price in prices]
+                candle.volume = volume
+                candle.trade_count = trade_count
+                candles.append(candle)
+            offset = records_end
+            yield exchange_id, symbol, interval, candles
+
+    def load(self, cache: Cache) -> int:
+        """
+        스냅샷의 캔들을 캐시의 빈 캔들 저장소에 채움
+        저장할 때 진행 중이던 마지막 캔들은 완성되지 않았으므로 버리고, 캐시에 저장소가 없는 시리즈는 무시함
+        :param cache: Cache, 캔들 저장소가 미리 확보된 캐시
+        :return: int, 캔들을 채운 시리즈 수
+        """
+        if not os.path.exists(self.path):
+            return 0
+        loaded_series_count = 0
+        current_timestamp = time.time()
+        for exchange_id, symbol, interval, candles in self.read():
+            candle_series: CandleSeries = cache.get_candle_series(exchange_id, symbol, interval)
+            if candle_series is None or len(candle_series) > 0 or len(candles) < 2:
+                continue
+            closed_candles = candles[:-1]
+            # 빈 구간이 저장할 캔들 수보다 길면 어차피 전부 다시 받아야 하므로 불러오지 않음
+            missing_candles_count = (current_timestamp - closed_candles[-1].time_limit) // interval.to_second
+            if missing_candles_count >= cache.candle_depth:
+                continue
+            for candle in closed_candles:
+                candle_series.append(candle)
+            loaded_series_count += 1
+        return loaded_series_count
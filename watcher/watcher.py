@@ -1,21 +1,24 @@
 import asyncio
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 import ccxt.pro as ccxt
-from ccxt import RequestTimeout
 from ccxt.base.types import Trade, OrderBook
 from telebot.async_telebot import AsyncTeleBot
-from telebot.asyncio_helper import ApiTelegramException
 
 from database.database import Database
-from database.definition import AlarmDict
-from database.definition import BollingerBandCondition, Condition
-from watcher import functions
-from watcher.definition import UPBIT_ID, BINANCE_ID, WhaleInfo
+from database.definition import AlarmDict, Condition
+from watcher.definition import UPBIT_ID, BINANCE_ID
 from watcher.definition import Interval, Candle
-from watcher.definition import TickInfo, RsiInfo, BollingerBandInfo
 from watcher.cache import Cache
+from watcher.connection import ExchangeConnection
+from watcher.evaluator import AlarmEvaluator
+from watcher.metrics import LatencyMetrics, MarketCounters, MetricsServer, ThroughputCounters
+from watcher.notifier import Notifier
+from watcher.outbox import Outbox
+from watcher.recorder import TapeRecorder
+from watcher.snapshot import CandleSnapshot
 from watcher.monitor import Monitor
 
 
@@ -38,35 +41,74 @@ class Alarm:
         self.condition = condition
         self.alerted_candle_timestamp: int = 0  # 마지막으로 알람을 보낸 캔들의 타임스탬프
 
+    @property
+    def condition(self) -> Condition:
+        return self._condition
+
+    # 조건이 바뀔 때마다 조건 검사 객체를 새로 생성함
+    @condition.setter
+    def condition(self, condition: Condition):
+        self._condition = condition
+        self.evaluator = AlarmEvaluator(self.exchange_id, self.symbol, condition)
+
     # 조건으로 설정된 인터벌들
     @property
     def intervals_need_to_be_watched(self) -> List[Interval]:
-        intervals: List[Interval] = []
-        # RSI 조건의 인터벌
-        rsi_condition = self.condition['rsi']
-        if rsi_condition is not None:
-            rsi_interval = Interval(**rsi_condition['interval'])
-            if rsi_interval not in intervals:
-                intervals.append(rsi_interval)
-        # 볼린저밴드 조건의 인터벌
-        bollinger_band_condition = self.condition['bollinger_band']
-        if bollinger_band_condition is not None:
-            bollinger_band_interval = Interval(**bollinger_band_condition['interval'])
-            if bollinger_band_interval not in intervals:
-                intervals.append(bollinger_band_interval)
-        return intervals
+        return self.evaluator.intervals
 
 
 class Watcher:
     order_book_limit = 20
-
-    def __init__(self, _database: Database, bot: AsyncTeleBot):
+    # 거래소별로 동시에 보낼 수 있는 과거 데이터 요청 수
+    backfill_concurrency = 4
+    # 시작할 때 종목 구독 묶음 사이의 대기 시간
+    bootstrap_stagger = 1.0
+    # 캔들 스냅샷 파일 경로와 저장 주기
+    snapshot_path = 'candle_snapshot.bin'
+    snapshot_period = 300
+    # 같은 채널의 알림을 한 메시지로 합치기 위해 기다리는 시간, 0이면 합치지 않음
+    alert_coalesce_window = 1.0
+
+    def __init__(self, _database: Database, bot: AsyncTeleBot, recorder: Optional[TapeRecorder] = None,
+                 exchange_factory: Optional[Callable] = None, metrics_port: Optional[int] = None,
+                 candle_depth: int = 100):
         self.database = _database
         self.bot = bot
+        # 거래소 ID로 ccxt.pro 거래소 객체를 만드는 함수, 주어지지 않으면 실제 거래소에 연결함
+        self.exchange_factory = exchange_factory or self.get_exchange
+        # 받은 거래와 호가를 파일에 기록하는 기록기, 주어지지 않으면 기록하지 않음
+        self.recorder = recorder
         self.loop = asyncio.get_event_loop()
-        self.cache = Cache()
+        # 종목/인터벌마다 캐시할 캔들 수
+        self.cache = Cache(candle_depth=candle_depth)
+        # 거래소별 웹소켓 연결
+        self.connections: Dict[int, ExchangeConnection] = {}
         # 활성화된 알람 리스트
         self.registered_alarms: Dict[int, Alarm] = {}
+        # (거래소, 종목)별 활성화된 알람 인덱스
+        self.market_alarm_index: Dict[Tuple[int, str], Dict[int, Alarm]] = {}
+        # (거래소, 종목, 인터벌)별 활성화된 알람 인덱스
+        self.interval_alarm_index: Dict[Tuple[int, str, Interval], Dict[int, Alarm]] = {}
+        # (거래소, 종목, 인터벌)별 진행 중인 과거 데이터 요청, 인터벌이 None이면 호가 요청
+        self.backfill_tasks: Dict[Tuple[int, str, Optional[Interval]], asyncio.Task] = {}
+        # 거래소별 과거 데이터 요청 동시 실행 제한
+        self.backfill_semaphores: Dict[int, asyncio.Semaphore] = {
+            UPBIT_ID: asyncio.Semaphore(self.backfill_concurrency),
+            BINANCE_ID: asyncio.Semaphore(self.backfill_concurrency)
+        }
+        # 시작할 때 활성화된 알람이 모두 조건 검사를 시작하면 설정되는 이벤트
+        self.ready = asyncio.Event()
+        self.snapshot = CandleSnapshot(self.snapshot_path)
+        # 거래 체결부터 알림 전송까지의 구간별 지연 시간
+        self.latency_metrics = LatencyMetrics()
+        # (거래소, 종목)별 누적 처리량
+        self.throughput = ThroughputCounters()
+        # 알림 전송 기록, 데이터베이스 없이 실행하면 기록하지 않음
+        self.outbox = Outbox(_database) if _database is not None else None
+        # 알림 전송 대기열, 거래 감시 태스크는 알림을 넣기만 하고 전송을 기다리지 않음
+        self.notifier = Notifier(bot, coalesce_window=self.alert_coalesce_window, outbox=self.outbox)
+        # 처리량과 상태를 내보내는 HTTP 서버, 포트가 주어지지 않으면 실행하지 않음
+        self.metrics_server = MetricsServer(self, port=metrics_port) if metrics_port is not None else None
         # self.monitor = Monitor()
 
     @property
@@ -75,18 +117,38 @@ class Watcher:
             UPBIT_ID: [],
             BINANCE_ID: []
         }
-        registered_alarms: List[Alarm] = list(self.registered_alarms.values())
-        for alarm in registered_alarms:
-            exchange_id = alarm.exchange_id
-            symbol = alarm.symbol
+        for exchange_id, symbol in self.market_alarm_index:
             registered_market_dict[exchange_id].append(symbol)
         return registered_market_dict
 
+    # 해당 종목을 감시하는 알람이 있는지 여부를 반환함
+    def is_market_registered(self, exchange_id: int, symbol: str) -> bool:
+        return (exchange_id, symbol) in self.market_alarm_index
+
     def run(self):
         self.loop.create_task(self.update_registered_alarms())
-        self.loop.create_task(self.cache.candle_update_task(period=0.3))
+        self.loop.create_task(self.cache.candle_update_task())
         self.loop.create_task(self.cache_cleaning_task())
-        self.loop.run_forever()
+        self.loop.create_task(self.snapshot_task())
+        self.loop.create_task(self.latency_metrics.report_task())
+        if self.recorder is not None:
+            self.loop.create_task(self.recorder.flush_task())
+        if self.metrics_server is not None:
+            self.loop.create_task(self.metrics_server.serve())
+        if self.outbox is not None:
+            self.outbox.create_table()
+            self.loop.create_task(self.outbox.flush_task())
+            self.loop.create_task(self.outbox.retry_task(self.notifier))
+        try:
+            self.loop.run_forever()
+        finally:
+            # 종료할 때 캔들 캐시를 저장해 다시 시작할 때 사용함
+            self.snapshot.save(self.cache)
+            # 전송되지 않은 알림이 다시 시작할 때 재전송되도록 남은 기록을 저장함
+            if self.outbox is not None:
+                self.outbox.close()
+            if self.recorder is not None:
+                self.recorder.close()
 
     @staticmethod
     def get_exchange(exchange_id: int):
@@ -101,18 +163,42 @@ class Watcher:
         exchange.enableRateLimit = True
         return exchange
 
+    # 거래소의 공유 연결을 반환함, 연결이 없을 경우 새로 생성함
+    def get_connection(self, exchange_id: int) -> ExchangeConnection:
+        if exchange_id not in self.connections:
+            self.connections[exchange_id] = ExchangeConnection(exchange_id, self.exchange_factory,
+                                                              self.order_book_limit)
+        return self.connections[exchange_id]
+
     def get_alarms(self, exchange_id: int, symbol: str, interval: Optional[Interval] = None) -> List[Alarm]:
-        alarms = [
-            alarm for alarm in self.registered_alarms.values()
-            if alarm.exchange_id == exchange_id
-            and alarm.symbol == symbol
-        ]
-        if interval is not None:
-            alarms = [
-                alarm for alarm in alarms
-                if interval in alarm.intervals_need_to_be_watched
-            ]
-        return alarms
+        if interval is None:
+            alarms = self.market_alarm_index.get((exchange_id, symbol), {})
+        else:
+            alarms = self.interval_alarm_index.get((exchange_id, symbol, interval), {})
+        return list(alarms.values())
+
+    # 알람을 인덱스에 추가함
+    def index_alarm(self, alarm: Alarm):
+        market_key = (alarm.exchange_id, alarm.symbol)
+        self.market_alarm_index.setdefault(market_key, {})[alarm.id] = alarm
+        for interval in alarm.intervals_need_to_be_watched:
+            interval_key = (alarm.exchange_id, alarm.symbol, interval)
+            self.interval_alarm_index.setdefault(interval_key, {})[alarm.id] = alarm
+
+    # 알람을 인덱스에서 삭제함, 알람의 조건이 바뀌기 전에 호출해야 함
+    def unindex_alarm(self, alarm: Alarm):
+        def remove_from_index(index: dict, key: tuple):
+            alarms = index.get(key)
+            if alarms is None:
+                return
+            alarms.pop(alarm.id, None)
+            # 더 이상 알람이 없는 키는 삭제함
+            if not alarms:
+                index.pop(key)
+
+        remove_from_index(self.market_alarm_index, (alarm.exchange_id, alarm.symbol))
+        for interval in alarm.intervals_need_to_be_watched:
+            remove_from_index(self.interval_alarm_index, (alarm.exchange_id, alarm.symbol, interval))
 
     def is_alarm_running(self, alarm_id: int) -> bool:
         return alarm_id in self.registered_alarms
@@ -140,54 +226,124 @@ class Watcher:
         symbol = alarm.symbol
         if alarm.condition == edited_alarm.condition:
             return
-        alarm.condition = edited_alarm.condition.copy()
-        # self.monitor.update_alarm(edited_alarm)
         # 캐시 공간 확보
         for interval in edited_alarm.intervals_need_to_be_watched:
             self.cache.create_candle_storage(exchange_id, symbol, interval)
-        await self.fetch_pre_data(alarm)
+        # 바뀐 조건에 필요한 과거 데이터를 먼저 불러옴, 실패하면 이전 조건을 유지하고 다음 갱신 주기에 다시 시도함
+        await self.fetch_pre_data(edited_alarm)
+        # 바뀐 조건의 인터벌로 인덱스를 다시 구성함
+        self.unindex_alarm(alarm)
+        alarm.condition = edited_alarm.condition.copy()
+        self.index_alarm(alarm)
+        # self.monitor.update_alarm(edited_alarm)
 
     async def register_alarm(self, alarm: Alarm):
-        exchange_id = alarm.exchange_id
-        symbol = alarm.symbol
         # 캐시 공간 확보
-        for interval in alarm.intervals_need_to_be_watched:
-            self.cache.create_candle_storage(exchange_id, symbol, interval)
-        self.cache.create_order_book_storage(exchange_id, symbol)
+        self.create_alarm_storage(alarm)
         # 알람 조건 검사에 필요한 캔들 데이터 캐시
         await self.fetch_pre_data(alarm)
-        # 이미 해당 종목에 대한 조건 검사 태스크가 실행 중이면 다음 알람으로 넘어감
-        if symbol in self.registered_markets[exchange_id]:
-            self.registered_alarms[alarm.id] = alarm  # 활성화된 알람 리스트에 알람 등록
-            # self.monitor.update_alarm(alarm)
-            return
+        self.arm_alarm(alarm)
+
+    # 알람 조건 검사에 필요한 캐시 공간 확보
+    def create_alarm_storage(self, alarm: Alarm):
+        for interval in alarm.intervals_need_to_be_watched:
+            self.cache.create_candle_storage(alarm.exchange_id, alarm.symbol, interval)
+        self.cache.create_order_book_storage(alarm.exchange_id, alarm.symbol)
+
+    # 과거 데이터가 준비된 알람을 활성화된 알람으로 등록하고, 새로운 종목이면 종목 감시 태스크를 시작함
+    # 새로운 종목의 감시를 시작했는지 여부를 반환함
+    def arm_alarm(self, alarm: Alarm) -> bool:
+        exchange_id = alarm.exchange_id
+        symbol = alarm.symbol
+        # 이미 해당 종목에 대한 조건 검사 태스크가 실행 중인지 여부
+        is_market_watched = self.is_market_registered(exchange_id, symbol)
         # 활성화된 알람 리스트에 알람 등록
         self.registered_alarms[alarm.id] = alarm
+        self.index_alarm(alarm)
+        # 이미 해당 종목에 대한 조건 검사 태스크가 실행 중이면 다음 알람으로 넘어감
+        if is_market_watched:
+            return False
         # self.monitor.update_alarm(alarm)
         # 해당 종목에 대한 거래 조건 검사 태스크를 이벤트 루프에 등록함
         self.loop.create_task(self.order_book_watching_task(exchange_id, symbol))
         self.loop.create_task(self.trade_watching_task(exchange_id, symbol))
+        return True
+
+    # 시작할 때 활성화된 알람들을 한꺼번에 준비함
+    # 필요한 과거 데이터를 먼저 모두 계획해 동시에 불러오고, 종목 구독은 묶음 단위로 나누어 시작함
+    # alarms가 주어지지 않으면 데이터베이스에서 활성화된 알람을 불러옴
+    async def bootstrap(self, alarms: Optional[List[Alarm]] = None):
+        started_at = time.time()
+        if alarms is None:
+            alarms = self.load_enabled_alarms()
+        # 필요한 (거래소, 종목, 인터벌) 캔들과 (거래소, 종목) 호가 계획
+        backfill_keys: Set[Tuple[int, str, Optional[Interval]]] = set()
+        for alarm in alarms:
+            self.create_alarm_storage(alarm)
+        # 이전에 저장한 캔들을 불러와 빈 구간만 요청함
+        loaded_series_count = self.snapshot.load(self.cache)
+        for alarm in alarms:
+            for interval in alarm.intervals_need_to_be_watched:
+                if not self.cache.is_candle_series_warm(alarm.exchange_id, alarm.symbol, interval):
+                    backfill_keys.add((alarm.exchange_id, alarm.symbol, interval))
+            backfill_keys.add((alarm.exchange_id, alarm.symbol, None))
+        # 거래소별 동시 요청 제한 안에서 모두 동시에 불러옴, 일부 요청이 실패해도 나머지 요청은 계속 진행함
+        backfill_keys_list = list(backfill_keys)
+        results = await asyncio.gather(*(self.backfill(*key) for key in backfill_keys_list), return_exceptions=True)
+        failed_backfill_keys: Set[Tuple[int, str, Optional[Interval]]] = set()
+        for key, result in zip(backfill_keys_list, results):
+            if isinstance(result, Exception):
+                failed_backfill_keys.add(key)
+                print(f"[{key[0]}] {key[1]} {key[2] or '호가'} 과거 데이터 요청 실패: {result!r}")
+        # 종목별 감시 태스크는 구독 묶음 크기만큼 시작한 뒤 잠시 기다림
+        # 과거 데이터를 불러오지 못한 알람은 등록하지 않고 다음 갱신 주기에 다시 등록함
+        started_markets_count = {UPBIT_ID: 0, BINANCE_ID: 0}
+        failed_alarms_count = 0
+        for alarm in alarms:
+            alarm_backfill_keys = [(alarm.exchange_id, alarm.symbol, interval)
+                                   for interval in alarm.intervals_need_to_be_watched]
+            alarm_backfill_keys.append((alarm.exchange_id, alarm.symbol, None))
+            if any(key in failed_backfill_keys for key in alarm_backfill_keys):
+                failed_alarms_count += 1
+                continue
+            self.prepare_indicators(alarm)
+            if not self.arm_alarm(alarm):
+                continue
+            started_markets_count[alarm.exchange_id] += 1
+            if started_markets_count[alarm.exchange_id] % ExchangeConnection.batch_size == 0:
+                await asyncio.sleep(self.bootstrap_stagger)
+        self.ready.set()
+        print(f"알람 {len(alarms) - failed_alarms_count}개 준비 완료, {failed_alarms_count}개 실패 "
+              f"({time.time() - started_at:.1f}초, 스냅샷 캔들 {loaded_series_count}개 사용)")
 
     def unregister_alarm(self, alarm_id: int):
-        self.registered_alarms.pop(alarm_id)
+        alarm = self.registered_alarms.pop(alarm_id)
+        self.unindex_alarm(alarm)
         # self.monitor.remove_alarm(alarm_id)
 
     # 활성화된 알람을 최신화함
     async def update_registered_alarms(self):
+        await self.bootstrap()
         while True:
             enabled_alarms = self.load_enabled_alarms()
+            enabled_alarm_ids = {_alarm.id for _alarm in enabled_alarms}
 
             def is_alarm_enabled(alarm_id):
-                enabled_alarm_ids = [_alarm.id for _alarm in enabled_alarms]
                 return alarm_id in enabled_alarm_ids
 
+            registrations = []
             for alarm in enabled_alarms:
                 # 이미 등록된 알람일 경우
                 if alarm.id in self.registered_alarms:
-                    await self.update_alarm_condition(alarm)
+                    registrations.append(self.update_alarm_condition(alarm))
                 # 등록되지 않은 새로운 알람일 경우 알람 등록
                 else:
-                    await self.register_alarm(alarm)
+                    registrations.append(self.register_alarm(alarm))
+            # 알람들의 과거 데이터 요청을 동시에 진행함, 실패한 알람은 다음 갱신 주기에 다시 시도함
+            results = await asyncio.gather(*registrations, return_exceptions=True)
+            for alarm, result in zip(enabled_alarms, results):
+                if isinstance(result, Exception):
+                    print(f"알람 {alarm.id} ({alarm.symbol}) 등록 실패: {result!r}")
             # 비활성화된 알람들의 ID 리스트
             unregistered_alarm_ids = [alarm_id for alarm_id in self.registered_alarms if not is_alarm_enabled(alarm_id)]
             # 등록된 알람 리스트에서 비활성화된 알람 삭제
@@ -197,115 +353,176 @@ class Watcher:
             await asyncio.sleep(5)
 
     # 알람을 등록했을 때 조건 검사를 위해서 필요한 과거 데이터를 불러옴
+    # 이미 캐시된 데이터는 다시 요청하지 않고, 서로 다른 데이터는 동시에 요청함
     async def fetch_pre_data(self, alarm: Alarm):
         exchange_id = alarm.exchange_id
-        exchange = self.get_exchange(alarm.exchange_id)
         symbol = alarm.symbol
-
-        # 과거의 캔들 데이터를 요청해 캔들 리스트로 반환함
-        async def fetch_candles(_interval: Interval, limit: int = 100) -> List[Candle]:
-            _candles: List[Candle] = []
-            candle_raw_list = await exchange.fetch_ohlcv(symbol=symbol, timeframe=str(_interval), limit=limit)
-            for candle_raw in candle_raw_list:
-                candle_datetime = datetime.fromtimestamp(candle_raw[0] / 1000)
-                _candle = Candle(exchange_id, symbol, candle_datetime, _interval)
-                _candle.open, _candle.high, _candle.low, _candle.close = candle_raw[1:5]
-                _candles.append(_candle)
-            return _candles
-
+        fetches = []
         # 캔들 데이터 요청
-        intervals = alarm.intervals_need_to_be_watched
-        for interval in intervals:
-            candles = await fetch_candles(interval)
-            added_candles_count = 0
-            for candle in candles:
-                if self.cache.add_candle(candle):
-                    added_candles_count += 1
-        # 호가 데이터 요청
-        order_books = await exchange.fetch_order_book(symbol, limit=20)
-        self.cache.cache_order_book(order_books, exchange_id, symbol)
-        # 거래소 연결 종료
-        await exchange.close()
+        for interval in alarm.intervals_need_to_be_watched:
+            if not self.cache.is_candle_series_warm(exchange_id, symbol, interval):
+                fetches.append(self.backfill(exchange_id, symbol, interval))
+        # 호가 데이터 요청, 이미 호가가 캐시되어 있으면 요청하지 않음
+        if not self.cache.has_order_book(exchange_id, symbol):
+            fetches.append(self.backfill(exchange_id, symbol, None))
+        await asyncio.gather(*fetches)
+        self.prepare_indicators(alarm)
+
+    # 알람이 사용하는 지표 상태가 없으면 불러온 캔들로 계산함
+    def prepare_indicators(self, alarm: Alarm):
+        exchange_id = alarm.exchange_id
+        symbol = alarm.symbol
+        evaluator = alarm.evaluator
+        if evaluator.rsi_interval is not None:
+            self.cache.get_rsi_state(exchange_id, symbol, evaluator.rsi_interval, evaluator.rsi_length)
+        if evaluator.bollinger_band_interval is not None:
+            self.cache.get_bollinger_band_state(exchange_id, symbol, evaluator.bollinger_band_interval,
+                                                evaluator.bollinger_band_length)
+
+    # (거래소, 종목, 인터벌)에 대한 과거 데이터 요청을 기다림, 같은 요청이 진행 중이면 새로 요청하지 않고 함께 기다림
+    async def backfill(self, exchange_id: int, symbol: str, interval: Optional[Interval]):
+        key = (exchange_id, symbol, interval)
+        task = self.backfill_tasks.get(key)
+        if task is None:
+            if interval is None:
+                task = self.loop.create_task(self.fetch_order_book(exchange_id, symbol))
+            else:
+                task = self.loop.create_task(self.fetch_candles(exchange_id, symbol, interval))
+            self.backfill_tasks[key] = task
+            task.add_done_callback(lambda _: self.backfill_tasks.pop(key, None))
+        await task
+
+    # 과거의 캔들 데이터를 요청해 캐시하고, 해당 인터벌의 지표 상태를 새로 계산함
+    # 스냅샷에서 불러온 캔들이 있으면 마지막 캔들 이후의 빈 구간만 요청함
+    async def fetch_candles(self, exchange_id: int, symbol: str, interval: Interval):
+        exchange = self.get_connection(exchange_id).exchange
+        since = None
+        limit = self.cache.candle_depth
+        last_candle = self.cache.get_last_candle(exchange_id, symbol, interval)
+        if last_candle is not None:
+            missing_candles_count = int(self.cache.exchange_time(exchange_id) - last_candle.time_limit) \
+                                    // interval.to_second + 1
+            if missing_candles_count < limit:
+                since = last_candle.time_limit * 1000
+                limit = missing_candles_count + 1
+        async with self.backfill_semaphores[exchange_id]:
+            candle_raw_list = await exchange.fetch_ohlcv(symbol=symbol, timeframe=str(interval),
+                                                         since=since, limit=limit)
+        for candle_raw in candle_raw_list:
+            candle_datetime = datetime.fromtimestamp(candle_raw[0] / 1000)
+            candle = Candle(exchange_id, symbol, candle_datetime, interval)
+            candle.open, candle.high, candle.low, candle.close = candle_raw[1:5]
+            candle.volume = candle_raw[5] or 0.0
+            self.cache.add_backfilled_candle(candle)
+        self.cache.seed_indicators(exchange_id, symbol, interval)
+
+    # 호가 데이터를 요청해 캐시함
+    async def fetch_order_book(self, exchange_id: int, symbol: str):
+        exchange = self.get_connection(exchange_id).exchange
+        async with self.backfill_semaphores[exchange_id]:
+            order_book: OrderBook = await exchange.fetch_order_book(symbol, limit=self.order_book_limit)
+        # 요청하는 동안 스트림으로 호가를 받았다면 더 최신인 스트림 호가를 유지함
+        if not self.cache.has_order_book(exchange_id, symbol):
+            self.cache.cache_order_book(order_book, exchange_id, symbol)
+
+    def last_candle_timestamp(self, alarm: Alarm) -> float:
+        """
+        alarm의 조건(거래소, 종목, 최소 인터벌)에 해당하는 캔들 중 가장 최신의 캔들의 타임스탬프를 반환함
+        :param alarm: Alarm, 찾으려는 캔들을 참조하는 알람
+        :return: int, 가장 최신의 캔들의 타임스탬프
+        """
+        shortest_interval = alarm.evaluator.shortest_interval  # 알람의 조건의 인터벌 중 가장 짧은 인터벌
+        last_candle = self.cache.get_last_candle(alarm.exchange_id, alarm.symbol,  # 마지막으로 거래를 캐시한 캔들
+                                                 shortest_interval)  # 캔들의 인터벌은 알람의 조건의 인터벌 중 가장 짧은 인터벌
+        if last_candle is None:
+            raise IndexError
+        timestamp = last_candle.timestamp  # 마지막으로 거래를 캐시한 캔들의 타임스탬프
+        return timestamp
+
+    def is_alarm_alerted(self, alarm: Alarm) -> bool:
+        """
+        alarm이 현재 캔들에서 알림이 이미 전송되었는지 여부를 반환함
+        :param alarm: Alarm, 알림 전송 여부를 확인할 알람
+        :return: bool, 알림 전송 여부
+        """
+        last_alerted_candle_timestamp = alarm.alerted_candle_timestamp  # 알람이 마지막으로 전송된 캔들의 타임스탬프
+        return last_alerted_candle_timestamp == self.last_candle_timestamp(alarm)
 
     # 거래를 감시하고 조건을 검사한 뒤 알람을 전송하는 태스크
     async def trade_watching_task(self, exchange_id: int, symbol: str):
-        def last_candle_timestamp(alarm: Alarm) -> float:
-            """
-            alarm의 조건(거래소, 종목, 최소 인터벌)에 해당하는 캔들 중 가장 최신의 캔들의 타임스탬프를 반환함
-            :param alarm: Alarm, 찾으려는 캔들을 참조하는 알람
-            :return: int, 가장 최신의 캔들의 타임스탬프
-            """
-            shortest_interval = min(alarm.intervals_need_to_be_watched)  # 알람의 조건의 인터벌 중 가장 짧은 인터벌
-            last_candle = self.cache.get_candles(exchange_id, symbol,  # 마지막으로 거래를 캐시한 캔들
-                                                 shortest_interval)[-1]  # 캔들의 인터벌은 알람의 조건의 인터벌 중 가장 짧은 인터벌
-            timestamp = last_candle.datetime.timestamp()  # 마지막으로 거래를 캐시한 캔들의 타임스탬프
-            return timestamp
-
-        def is_alarm_alerted(alarm: Alarm) -> bool:
-            """
-            alarm이 현재 캔들에서 알림이 이미 전송되었는지 여부를 반환함
-            :param alarm: Alarm, 알림 전송 여부를 확인할 알람
-            :return: bool, 알림 전송 여부
-            """
-            last_alerted_candle_timestamp = alarm.alerted_candle_timestamp  # 알람이 마지막으로 전송된 캔들의 타임스탬프
-            return last_alerted_candle_timestamp == last_candle_timestamp(alarm)
-
-        exchange = self.get_exchange(exchange_id)
+        connection = self.get_connection(exchange_id)
+        trade_queue = connection.subscribe_trades(symbol)
+        market_latency = self.latency_metrics.get_market(exchange_id, symbol)
+        market_counters = self.throughput.get_market(exchange_id, symbol)
         # 거래 감시
         while True:
-            # 감시해야 하는 종목 리스트
-            registered_markets = self.registered_markets
-            # 감시해야 하는 종목 리스트에 해당 종목이 더 이상 존재하지 않을 경우 태스크 종료
-            if symbol not in registered_markets[exchange_id]:
+            # 해당 종목을 감시하는 알람이 더 이상 존재하지 않을 경우 태스크 종료
+            if not self.is_market_registered(exchange_id, symbol):
                 # 해당 종목의 캔들 캐시 삭제
-                self.cache.candles[exchange_id].pop(symbol)
-                await exchange.close()
+                self.cache.remove_candle_storage(exchange_id, symbol)
+                connection.unsubscribe_trades(symbol)
                 break
-            # 거래 리스트 요청
-            try:
-                trades: List[Trade] = await exchange.watch_trades(symbol)
-            except RequestTimeout:
-                # 거래소 연결 종료 후 재연결
-                await exchange.close()
-                exchange = self.get_exchange(exchange_id)
-                continue
+            # 공유 연결에서 해당 종목의 거래 리스트를 받음
+            received_at, trades = await trade_queue.get()
+            if self.recorder is not None:
+                self.recorder.record_trades(exchange_id, trades)
             # 해당 종목에 대한 알람 리스트
-            alarms = [
-                alarm for alarm in self.registered_alarms.values()
-                if alarm.exchange_id == exchange_id
-                and alarm.symbol == symbol
-            ]
+            alarms = self.get_alarms(exchange_id, symbol)
+            market_counters.trades += len(trades)
             # 각 거래마다 알람 조건에 부합하는지 확인 후 조건에 맞을 시 알람을 전송함
             for trade in trades:
+                if trade['timestamp'] is not None:
+                    market_latency.exchange_to_receive.record(received_at * 1000 - trade['timestamp'])
                 # 거래를 캔들에 캐시함
                 self.cache.cache_trade(trade, exchange_id)
-                for alarm in alarms:
-                    # 알람에 캔들을 조회해야 하는 조건이 존재하고 이미 알림이 전송된 알람이라면 다음 알람으로 진행
-                    try:
-                        if alarm.intervals_need_to_be_watched and is_alarm_alerted(alarm):
-                            continue
-                    except IndexError:
-                        pass
-                    # 알람 조건 확인 결과
-                    try:
-                        check_result = self.check_alarm(alarm, trade)
-                    except IndexError:
-                        continue
-                    is_alarm_triggered = check_result['is_alarm_triggered']
+                evaluated_at = time.time()
+                market_latency.receive_to_evaluate.record((evaluated_at - received_at) * 1000)
+                for alarm, check_result in self.evaluate_alarms(alarms, trade, market_counters):
                     # 알람 모니터에 조건 업데이트
                     # self.monitor.update_check_result(alarm.id, check_result)
-                    # 거래가 알람 조건에 맞지 않으면 다음 알람으로 진행
-                    if not is_alarm_triggered:
-                        continue
                     # 조건에 맞을 경우 알람 전송
-                    try:
-                        await self.send_alarm(alarm, check_result)
-                    except ApiTelegramException:
-                        pass
-                    else:
-                        # 마지막으로 알람을 전송한 캔들의 타임스탬프 갱신
-                        if alarm.intervals_need_to_be_watched:
-                            alarm.alerted_candle_timestamp = last_candle_timestamp(alarm)
+                    market_latency.evaluate_to_send.record((time.time() - evaluated_at) * 1000)
+                    self.send_alarm(alarm, check_result)
+
+    def evaluate_alarms(self, alarms: List[Alarm], trade: Trade,
+                        market_counters: Optional[MarketCounters] = None) -> Iterator[Tuple[Alarm, dict]]:
+        """
+        거래 하나로 종목의 알람 조건을 검사해 조건을 만족한 알람과 검사 결과를 차례로 반환함
+        호출한 쪽이 알림을 처리한 뒤 다음 결과를 요청하면 해당 알람을 지금 캔들에서 알림을 보낸 알람으로 표시함
+        :param alarms: List[Alarm], 거래가 체결된 종목의 알람 리스트
+        :param trade: Trade, 검사할 거래
+        :param market_counters: MarketCounters, 검사 횟수와 조건을 만족한 횟수를 셀 종목의 처리량, 주어지지 않으면 세지 않음
+        :return: Iterator[Tuple[Alarm, dict]], (알람, 검사 결과)
+        """
+        for alarm in alarms:
+            # 알람에 캔들을 조회해야 하는 조건이 존재하고 이미 알림이 전송된 알람이라면 다음 알람으로 진행
+            try:
+                if alarm.intervals_need_to_be_watched and self.is_alarm_alerted(alarm):
+                    continue
+            except IndexError:
+                pass
+            # 알람 조건 확인 결과
+            if market_counters is not None:
+                market_counters.alarms_evaluated += 1
+            try:
+                check_result = self.check_alarm(alarm, trade)
+            except IndexError:
+                continue
+            # 거래가 알람 조건에 맞지 않으면 다음 알람으로 진행
+            if check_result is None:
+                continue
+            if market_counters is not None:
+                market_counters.alarms_fired += 1
+            yield alarm, check_result
+            # 마지막으로 알람을 보낸 캔들의 타임스탬프 갱신
+            if alarm.intervals_need_to_be_watched:
+                alarm.alerted_candle_timestamp = self.last_candle_timestamp(alarm)
+
+    # 일정 시간마다 캔들 캐시를 파일로 저장하는 태스크
+    async def snapshot_task(self):
+        while True:
+            await asyncio.sleep(self.snapshot_period)
+            self.snapshot.save(self.cache)
 
     # 캐시 저장소 공간에서 필요없는 공간을 정리하는 태스크
     async def cache_cleaning_task(self):
@@ -318,234 +535,48 @@ class Watcher:
                 for symbol in exchange_candle_storage.copy():
                     # 해당 종목을 감시하는 알람이 없을 경우 해당 종목의 캔들 저장소 삭제
                     if not self.get_alarms(exchange_id, symbol):
-                        exchange_candle_storage.pop(symbol)
+                        self.cache.remove_candle_storage(exchange_id, symbol)
                         continue
                     symbol_candle_storage = exchange_candle_storage[symbol]  # 종목의 캔들 저장소
                     # 해당 언터벌을 감시하는 알람이 없을 경우 해당 인터벌의 캔들 저장소 삭제
                     for interval in symbol_candle_storage.copy():
                         if not self.get_alarms(exchange_id, symbol, interval):
-                            symbol_candle_storage.pop(interval)
+                            self.cache.remove_candle_storage(exchange_id, symbol, interval)
                 # 호가 저장소 정리
                 exchange_order_book_storage = self.cache.order_books[exchange_id]  # 거래소의 호가 저장소
                 for symbol in exchange_order_book_storage.copy():
                     # 해당 종목을 감시하는 알람이 없을 경우 해당 종목의 호가 저장소 삭제
                     if not self.get_alarms(exchange_id, symbol):
-                        exchange_order_book_storage.pop(symbol)
+                        self.cache.remove_order_book(exchange_id, symbol)
             # 300초마다 반복
             await asyncio.sleep(300)
 
     async def order_book_watching_task(self, exchange_id: int, symbol: str):
-        exchange = self.get_exchange(exchange_id)
+        connection = self.get_connection(exchange_id)
+        order_book_queue = connection.subscribe_order_book(symbol)
+        market_counters = self.throughput.get_market(exchange_id, symbol)
         # 호가 감시
         while True:
-            try:
-                # 현재 호가 정보 요청
-                await exchange.watch_order_book(symbol=symbol, limit=20)
-            except RequestTimeout:
-                # 거래소 연결 종료 후 재연결
-                await exchange.close()
-                exchange = self.get_exchange(exchange_id)
-                continue
-            # 감시해야 하는 종목 리스트
-            registered_markets = self.registered_markets
-            # 감시해야 하는 종목 리스트에 해당 종목이 더 이상 존재하지 않을 경우 태스크 종료
-            if symbol not in registered_markets[exchange_id]:
+            # 공유 연결에서 해당 종목의 현재 호가 정보를 받음
+            order_book: OrderBook = await order_book_queue.get()
+            # 해당 종목을 감시하는 알람이 더 이상 존재하지 않을 경우 태스크 종료
+            if not self.is_market_registered(exchange_id, symbol):
                 # 해당 종목의 호가 캐시 삭제
-                self.cache.order_books[exchange_id].pop(symbol)
-                await exchange.close()
+                self.cache.remove_order_book(exchange_id, symbol)
+                connection.unsubscribe_order_book(symbol)
                 break
-            # 호가 정보를 캐시함
-            order_book = exchange.orderbooks[symbol]
+            if self.recorder is not None:
+                self.recorder.record_order_book(exchange_id, symbol, order_book)
+            # 웹소켓으로 호가가 갱신될 때마다 호가 정보를 캐시함
             self.cache.cache_order_book(order_book, exchange_id, symbol)
-            await asyncio.sleep(0.1)
+            market_counters.order_book_updates += 1
 
-    # 호가에서 고래를 감시하는 함수
-    def check_whale(self, alarm: Alarm):
-        whale_condition = alarm.condition['whale']
-        is_condition_none = whale_condition is None
-        # 호가 불러오기
-        exchange_id = alarm.exchange_id
-        symbol = alarm.symbol
-        order_book: OrderBook = self.cache.order_books[exchange_id][symbol]
-        whale_info = WhaleInfo(
-            is_condition_none=is_condition_none,
-            has_whale=None,
-            whales_in_bids=[],
-            whales_in_asks=[],
-            order_book=order_book
-        )
-        if is_condition_none:
-            return whale_info
-        whale_info['has_whale'] = False
-        # 호가에서 고래를 확인함
-        quantity = whale_condition['quantity']
-        # 매도 호가에서 고래 확인
-        for order_unit in order_book['bids']:
-            order_unit: List[float]
-            price, amount = order_unit
-            if price * amount >= quantity:
-                whale_info['has_whale'] = True
-                whale_info['whales_in_bids'].append(order_unit.copy())
-        # 매수 호가에서 고래 확인
-        for order_unit in order_book['asks']:
-            order_unit: List[float]
-            price, amount = order_unit
-            if price * amount >= quantity:
-                whale_info['has_whale'] = True
-                whale_info['whales_in_asks'].append(order_unit.copy())
-        return whale_info
-
-    # 거래의 체결량을 감시하는 함수
-    @staticmethod
-    def check_tick(alarm: Alarm, trade: Trade):
-        tick_condition = alarm.condition['tick']
-        is_condition_none = tick_condition is None
-        tick_info = TickInfo(
-            is_condition_none=is_condition_none,
-            is_breakout=None,
-            trade=trade,
-            condition=tick_condition
-        )
-        if is_condition_none:
-            return tick_info
-        quantity = tick_condition['quantity']
-        # 거래량 조건 확인
-        tick_info['is_breakout'] = trade['amount'] >= quantity
-        return tick_info
-
-    # RSI 지표를 확인하는 함수
-    def check_rsi(self, alarm: Alarm, trade: Trade):
-        rsi_condition = alarm.condition['rsi']
-        is_condition_none = rsi_condition is None
-        rsi_info = RsiInfo(
-            is_condition_none=is_condition_none,
-            is_over_upper_bound=None,
-            is_under_lower_bound=None,
-            rsi=None,
-            trade=trade,
-            condition=rsi_condition
-        )
-        if is_condition_none:
-            return rsi_info
-        exchange_id = alarm.exchange_id
-        symbol = alarm.symbol
-        interval = Interval(**rsi_condition['interval'])
-        rsi_length = rsi_condition['length']
-        since = int(datetime.now().timestamp() - rsi_length * 86400)
-        candles = self.cache.get_candles(exchange_id, symbol, interval, since)
-        # 캔들의 종가 리스트
-        price_list = [candle.close for candle in candles]
-        # RSI 값 계산
-        rsi_value = functions.rsi(price_list, rsi_length)
-        rsi_info['rsi'] = rsi_value
-        # RSI 조건 확인
-        upper_bound = rsi_condition['upper_bound']
-        rsi_info['is_over_upper_bound'] = upper_bound <= rsi_value
-        lower_bound = rsi_condition['lower_bound']
-        rsi_info['is_under_lower_bound'] = lower_bound >= rsi_value
-        return rsi_info
-
-    # 볼린저 밴드 지표를 확인하는 함수
-    def check_bollinger_band(self, alarm: Alarm, trade: Trade):
-        bollinger_band_condition = alarm.condition['bollinger_band']
-        is_condition_none = bollinger_band_condition is None
-        bollinger_band_info = BollingerBandInfo(
-            is_condition_none=is_condition_none,
-            is_over_upper_band=None,
-            is_under_lower_band=None,
-            upper_band=None,
-            lower_band=None,
-            trade=trade,
-            condition=bollinger_band_condition
-        )
-        if is_condition_none:
-            return bollinger_band_info
-        exchange_id = alarm.exchange_id
-        symbol = alarm.symbol
-        # 조건의 인터벌
-        interval = Interval(**bollinger_band_condition['interval'])
-        # 조건의 길이
-        length = bollinger_band_condition['length']
-        # 해당 인터벌의 캔들 리스트
-        candles = self.cache.get_candles(exchange_id, symbol, interval)[-length:]
-        # 캔들의 종가 리스트
-        price_list = [candle.close for candle in candles]
-        # 조건의 표준편차
-        coefficient = bollinger_band_condition['coefficient']
-        # 볼린저 밴드 계산
-        basis_band, upper_band, lower_band = functions.bollinger_band(price_list, coefficient)
-        bollinger_band_info['upper_band'] = upper_band  # 상단선
-        bollinger_band_info['lower_band'] = lower_band  # 하단선
-        # 볼린저 밴드 조건 확인
-        is_over_upper_band = upper_band <= trade['price']
-        bollinger_band_info['is_over_upper_band'] = is_over_upper_band
-        is_under_lower_band = lower_band >= trade['price']
-        bollinger_band_info['is_under_lower_band'] = is_under_lower_band
-        return bollinger_band_info
-
-    def check_alarm(self, alarm: Alarm, trade: Trade) -> dict:
-        check_result = {
-            'is_alarm_triggered': False,  # 알람 조건 달성 여부
-            'whales': None,  # 발견한 고래, 지정된 고래 조건이 있고 고래가 발견될 경우 업데이트됨
-            'rsi': None,  # RSI 값, 지정된 RSI 조건이 있고 해당 조건을 달성한 경우 값이 업데이트됨
-            'crossed_band': None,  # 돌파한 볼린저 밴드 이름, 지정된 볼린저 밴드 조건이 있고 조건을 달성한 경우 해당 밴드의 이름이 업데이트됨
-            # 상단선 돌파 시: 'upper_band'
-            # 하단선 돌파 시: 'lower_band'
-            'trade': trade  # 검사한 거래 정보
-        }
-        # 지정된 고래 조건이 있을 경우 검사
-        whale_info = self.check_whale(alarm)
-        if not whale_info['is_condition_none']:
-            # 발견된 고래가 없을 경우 검사 종료
-            if not whale_info['has_whale']:
-                return check_result
-            # 발견된 고래를 검사 결과에 업데이트
-            check_result['whales'] = {
-                'bids': whale_info['whales_in_bids'].copy(),
-                'asks': whale_info['whales_in_asks'].copy()
-            }
-        # 지정된 거래량 조건이 있을 경우 검사
-        tick_info = self.check_tick(alarm, trade)
-        if not tick_info['is_condition_none']:
-            # 조건에 맞지 않는 경우 검사 종료
-            if not tick_info['is_breakout']:
-                return check_result
-        # 지정된 RSI 조건이 있을 경우 검사
-        rsi_info = self.check_rsi(alarm, trade)
-        if not rsi_info['is_condition_none']:
-            is_over_upper_bound = rsi_info['is_over_upper_bound']  # 상향 돌파 여부
-            is_under_lower_bound = rsi_info['is_under_lower_bound']  # 하향 돌파 여부
-            # 두 기준 모두 돌파하지 못했을 경우 검사 종료
-            if not (is_over_upper_bound or is_under_lower_bound):
-                return check_result
-            # RSI 조건 통과 시 검사 결과 딕셔너리에 RSI 값 추가
-            rsi_value = rsi_info['rsi']
-            check_result['rsi'] = rsi_value
-        # 지정된 볼린저 밴드 조건이 있을 경우 검사
-        bollinger_band_info = self.check_bollinger_band(alarm, trade)
-        if not bollinger_band_info['is_condition_none']:
-            # 볼린저 밴드 알람 조건
-            bollinger_band_condition: BollingerBandCondition = bollinger_band_info['condition']
-            on_over_upper_band = bollinger_band_condition['on_over_upper_band']  # 상단선 돌파 시 알람 여부
-            # 상단선 돌파 시 알람 여부와 상단선 돌파 여부가 모두 참일 경우 검사 결과 딕셔너리에 기록
-            if on_over_upper_band:
-                is_over_upper_band = bollinger_band_info['is_over_upper_band']  # 상단선 돌파 여부
-                if is_over_upper_band:
-                    check_result['crossed_band'] = 'upper_band'
-            on_under_lower_band = bollinger_band_condition['on_under_lower_band']  # 하단선 돌파 시 알람 여부
-            # 하단선 돌파 시 알람 여부와 하단선 돌파 여부가 모두 참일 경우 검사 결과 딕셔너리에 기록
-            if on_under_lower_band:
-                is_under_lower_band = bollinger_band_info['is_under_lower_band']  # 하단선 돌파 여부
-                if is_under_lower_band:
-                    check_result['crossed_band'] = 'lower_band'
-            # 돌파한 밴드가 없을 경우 검사 종료
-            if check_result['crossed_band'] is None:
-                return check_result
-        # 검사를 모두 통과한 경우 check_result 딕셔너리의 'is_alarm_triggered' 키의 값을 True로 변경
-        check_result['is_alarm_triggered'] = True
-        return check_result
-
-    async def send_alarm(self, alarm: Alarm, check_result: dict):
+    # 거래가 알람 조건을 모두 만족하면 검사 결과를, 아니면 None을 반환함
+    def check_alarm(self, alarm: Alarm, trade: Trade) -> Optional[dict]:
+        return alarm.evaluator.evaluate(self.cache, trade)
+
+    # 알람 메시지를 전송 대기열에 넣음, 대기열이 가득 차 버린 알림은 Notifier가 세고 기록함
+    def send_alarm(self, alarm: Alarm, check_result: dict):
         exchange_id = alarm.exchange_id
         exchange_name = get_exchange_name(exchange_id)
         symbol = alarm.symbol
@@ -571,7 +602,10 @@ class Watcher:
             }
             breaked_band = band_name[crossed_band]
             msg += f"볼린저 밴드 {breaked_band} 돌파!"
-        await self.bot.send_message(alarm.channel_id, msg)
+        market_latency = self.latency_metrics.get_market(exchange_id, symbol)
+        # 알림을 버렸으면 고래 정보도 보내지 않음
+        if not self.notifier.enqueue(alarm.channel_id, msg, market_latency):
+            return
         # 고래 정보 알림
         whales = check_result['whales']
         if whales is not None:
@@ -584,4 +618,4 @@ class Watcher:
             for order_unit in whales['bids']:
                 price, amount = order_unit
                 msg += f"{amount:,.2f} {alarm.base_symbol}@{price:,.2f} {alarm.quote_symbol} / 총액: {price * amount:,.2f} {alarm.quote_symbol}\n"
-            await self.bot.send_message(alarm.channel_id, msg)
+            self.notifier.enqueue(alarm.channel_id, msg, market_latency)